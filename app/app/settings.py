@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
@@ -17,6 +18,23 @@ import os
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+def _from_environ(**variables):
+    """
+    Return {key: cast(value)} for the keys whose (environment variable,
+    cast) pair names a variable that is set. Keys left out take their
+    defaults from core.conf.
+    """
+    return {
+        key: cast(os.environ[name])
+        for key, (name, cast) in variables.items()
+        if os.environ.get(name)
+    }
+
+
+def _flag(value):
+    return value == '1'
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
@@ -44,9 +62,11 @@ INSTALLED_APPS = [
     'drf_spectacular',
     'user',
     'recipe',
+    'job',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +74,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.HashingBusyMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -82,11 +103,25 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Set DB_ENGINE to core.db.backends.postgresql_pool to reuse
+        # connections from a per process pool configured by POOL below.
+        'ENGINE': os.environ.get(
+            'DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'HOST': os.environ.get('DB_HOST'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Limits apply to each worker process
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_IDLE': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            'MAX_LIFETIME': float(
+                os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+            'CHECK_INTERVAL': float(
+                os.environ.get('DB_POOL_CHECK_INTERVAL', 30)),
+        },
     }
 }
 
@@ -109,6 +144,43 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The hasher new passwords use, others still verify existing hashes and
+# are upgraded to it on the next login. Argon2 needs argon2-cffi, bcrypt
+# needs bcrypt.
+_PASSWORD_HASHERS = {
+    'argon2': 'core.hashers.Argon2PasswordHasher',
+    'bcrypt': 'core.hashers.BCryptSHA256PasswordHasher',
+    'pbkdf2': 'core.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER') or (
+    'argon2' if find_spec('argon2') else 'pbkdf2')
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHER
+]
+
+# Hash costs, unset ones use Django's defaults, and the worker pool that
+# bounds how many hashes run at once per process (0 workers hashes inline)
+PASSWORD_HASHING = {
+    'WORKERS': os.cpu_count() or 1,
+    **_from_environ(
+        WORKERS=('PASSWORD_HASH_WORKERS', int),
+        QUEUE=('PASSWORD_HASH_QUEUE', int),
+        WAIT=('PASSWORD_HASH_WAIT', float),
+    ),
+    **{
+        name: int(os.environ[name])
+        for name in (
+            'PBKDF2_ITERATIONS',
+            'ARGON2_TIME_COST',
+            'ARGON2_MEMORY_COST',
+            'ARGON2_PARALLELISM',
+            'BCRYPT_ROUNDS',
+        )
+        if os.environ.get(name)
+    },
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -129,6 +201,10 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Files written and read by background jobs, such as exports and uploads,
+# on a volume shared by the app and worker containers
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', '/vol/web/media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -138,4 +214,87 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'core.User'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-}
\ No newline at end of file
+    # JSON through orjson, falling back to the json module without it
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Default number of rows per page on the cursor paginated list endpoints
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+
+# Token to user resolution cache used by CachedTokenAuthentication.
+# BACKEND may name an entry of CACHES shared between worker processes.
+# Without a shared BACKEND other worker processes may accept a revoked
+# token for up to LOCAL_TTL seconds.
+TOKEN_AUTH_CACHE = _from_environ(
+    MAX_SIZE=('TOKEN_AUTH_CACHE_SIZE', int),
+    TTL=('TOKEN_AUTH_CACHE_TTL', int),
+    LOCAL_TTL=('TOKEN_AUTH_CACHE_LOCAL_TTL', int),
+    BACKEND=('TOKEN_AUTH_CACHE_BACKEND', str),
+)
+
+# Rendered response cache for the recipe and tag read endpoints
+RESPONSE_CACHE = _from_environ(
+    MAX_ENTRIES=('RESPONSE_CACHE_ENTRIES', int),
+    MAX_BYTES=('RESPONSE_CACHE_BYTES', int),
+    TTL=('RESPONSE_CACHE_TTL', int),
+)
+
+# Largest list accepted by the bulk recipe endpoint
+API_BULK_MAX_ITEMS = int(os.environ.get('API_BULK_MAX_ITEMS', 5000))
+# Rows fetched, and tag lookups batched, per step of the streaming export
+API_EXPORT_CHUNK_SIZE = int(os.environ.get('API_EXPORT_CHUNK_SIZE', 1000))
+# Rows validated and committed per transaction by the recipe import
+API_IMPORT_BATCH_SIZE = int(os.environ.get('API_IMPORT_BATCH_SIZE', 1000))
+# Worker threads, and so database connections per process, that run the
+# ORM work of the async API views
+ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 10))
+
+# Database backed job queue run by the run_worker command. Jobs not
+# reporting progress for LEASE seconds are run again by another worker,
+# failed attempts are retried after RETRY_DELAY seconds doubling each time.
+# The /metrics job counts are reused for METRICS_TTL seconds and files such
+# as exports kept FILE_TTL seconds by the clean_job_files command.
+JOB_QUEUE = _from_environ(
+    LEASE=('JOB_LEASE', int),
+    POLL_INTERVAL=('JOB_POLL_INTERVAL', float),
+    MAX_ATTEMPTS=('JOB_MAX_ATTEMPTS', int),
+    RETRY_DELAY=('JOB_RETRY_DELAY', int),
+    MAX_RETRY_DELAY=('JOB_MAX_RETRY_DELAY', int),
+    METRICS_TTL=('JOB_METRICS_TTL', int),
+    FILE_TTL=('JOB_FILE_TTL', int),
+)
+
+# The /metrics endpoint answers staff users and scrapers sending
+# "Authorization: Bearer <TOKEN>", and 404 when not ENABLED.
+METRICS = _from_environ(
+    ENABLED=('METRICS_ENABLED', _flag),
+    TOKEN=('METRICS_TOKEN', str),
+)
+
+# Request instrumentation by core.middleware.PerformanceMiddleware.
+# Requests running more queries than the budget for their method and URL
+# name, else for their URL name, are logged.
+PERFORMANCE = {
+    'DEFAULT_QUERY_BUDGET': 20,
+    **_from_environ(
+        SERVER_TIMING=('SERVER_TIMING', _flag),
+        DEFAULT_QUERY_BUDGET=('DEFAULT_QUERY_BUDGET', int),
+    ),
+    'QUERY_BUDGETS': {
+        'GET recipe:recipe-list': 5,
+        'GET recipe:recipe-detail': 6,
+        'GET recipe:tag-list': 4,
+        'GET recipe:tag-stats': 4,
+        'POST recipe:tag-merge': 12,
+        # Imports run a handful of queries per batch of the upload
+        'POST recipe:recipe-import': None,
+    },
+}
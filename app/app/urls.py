@@ -23,9 +23,14 @@ from drf_spectacular.views import (
 from django.contrib import admin
 from django.urls import path, include
 
+from core import views as core_views
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('healthz', core_views.healthz, name='healthz'),
+    path('readyz', core_views.readyz, name='readyz'),
+    path('metrics', core_views.metrics_view, name='metrics'),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     path(
         'api/docs/',
@@ -33,6 +38,7 @@ urlpatterns = [
          name='api-docs'),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    path('api/job/', include('job.urls')),
 ]
 
 
@@ -0,0 +1,53 @@
+"""
+Running ORM code from async views
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process wide pool of database threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_DB_THREADS,
+                thread_name_prefix='async-db',
+            )
+    return _executor
+
+
+def _call(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_thread(func, *args, **kwargs):
+    """
+    Await func(*args, **kwargs) run on the database thread pool.
+
+    Each of the ASYNC_DB_THREADS threads keeps its own connection, so at
+    most that many connections are used however many requests are waiting.
+    Stale connections are closed around every call as the request signals
+    do for synchronous views. Unlike sync_to_async with thread_sensitive,
+    calls run in parallel rather than one at a time on a single thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(context.run, _call, func, args, kwargs),
+    )
@@ -0,0 +1,583 @@
+"""
+Dataset seeding and timing helpers for the benchmark command
+"""
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, models, transaction
+from django.db.backends.signals import connection_created
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import seeding
+from core.models import Recipe, Tag, tag_key
+
+
+SEED_PASSWORD = seeding.SEED_PASSWORD
+
+
+def allowed_host():
+    """Return a host name the ALLOWED_HOSTS validation accepts"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of values"""
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def summarize(durations):
+    """Return p50/p99/mean in milliseconds for a list of durations"""
+    return {
+        'p50_ms': percentile(durations, 50) * 1000,
+        'p99_ms': percentile(durations, 99) * 1000,
+        'mean_ms': statistics.mean(durations) * 1000,
+    }
+
+
+def time_call(func, repeat):
+    """Call func repeat times and return the durations in seconds"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def seed_dataset(users, recipes_per_user, tags_per_user=20,
+                 tags_per_recipe=3, prefix='bench'):
+    """
+    Create users with tags and tagged recipes through the bulk loader.
+    Returns the ids of the created users.
+    """
+    return seeding.generate(
+        seeding.Loader(seeding.get_writer()),
+        users,
+        recipes_per_user,
+        tags_per_user=tags_per_user,
+        tags_per_recipe=tags_per_recipe,
+        prefix=prefix,
+    )
+
+
+def hot_queries(user_id, page_size=100):
+    """Return the named hot path queries for one user"""
+    newest = (
+        Recipe.objects.filter(user_id=user_id)
+        .order_by('-id').values_list('id', flat=True).first()
+    ) or 0
+    return {
+        'recipe_list': (
+            Recipe.objects.filter(user_id=user_id).order_by('-id')
+            [:page_size]
+        ),
+        'recipe_keyset_page': (
+            Recipe.objects.filter(user_id=user_id, id__lt=newest // 2)
+            .order_by('-id')[:page_size]
+        ),
+        'tag_list': (
+            Tag.objects.filter(user_id=user_id).order_by('-id')[:page_size]
+        ),
+        # Tags are found by name the way get_or_create_many() does
+        'tag_lookup': Tag.objects.filter(
+            user_id=user_id,
+            key__in=[tag_key(name) for name in ('Tag 1', 'Tag 2', 'Missing')],
+        ),
+    }
+
+
+def benchmark_queries(user_ids, repeat=20):
+    """Time the hot path queries and capture their query plans"""
+    results = {}
+    for user_id in user_ids:
+        for name, queryset in hot_queries(user_id).items():
+            result = results.setdefault(name, {'durations': []})
+            result['plan'] = queryset.explain()
+            result['durations'] += time_call(
+                lambda: list(queryset.all()), repeat)
+    return {
+        name: {'plan': result['plan'], **summarize(result['durations'])}
+        for name, result in results.items()
+    }
+
+
+def benchmark_queries_without(indexes, user_ids, repeat=20):
+    """
+    Benchmark the hot path queries with the given (model, index) pairs
+    dropped, restoring them by rolling the schema change back. Requires a
+    backend with transactional DDL such as PostgreSQL.
+    """
+    results = {}
+    try:
+        with transaction.atomic():
+            with connection.schema_editor(atomic=False) as editor:
+                for model, index in indexes:
+                    if isinstance(index, models.Index):
+                        editor.remove_index(model, index)
+                    else:
+                        editor.remove_constraint(model, index)
+            results = benchmark_queries(user_ids, repeat)
+            raise _Rollback
+    except _Rollback:
+        pass
+    return results
+
+
+class _Rollback(Exception):
+    pass
+
+
+def benchmark_serializers(user_id, repeat=5):
+    """
+    Time rendering all of a user's recipes to JSON with RecipeSerializer
+    and with the values() based FastRecipeSerializer list path.
+    """
+    from rest_framework.renderers import JSONRenderer
+    from recipe.mixins import plan_queryset
+    from recipe.serializers import FastRecipeSerializer, RecipeSerializer
+
+    queryset = Recipe.objects.filter(user_id=user_id).order_by('-id')
+    renderer = JSONRenderer()
+
+    def render(serializer_class):
+        serializer = serializer_class(many=True)
+        serializer.instance = plan_queryset(queryset, serializer)
+        return renderer.render(serializer.data)
+
+    outputs = {}
+    results = {}
+    for name, serializer_class in (
+            ('RecipeSerializer', RecipeSerializer),
+            ('FastRecipeSerializer', FastRecipeSerializer)):
+        outputs[name] = render(serializer_class)
+        results[name] = summarize(
+            time_call(lambda: render(serializer_class), repeat))
+    return results, len(set(outputs.values())) == 1
+
+
+def benchmark_renderers(user_id, repeat=5):
+    """
+    Time rendering all of a user's recipes to JSON, and parsing the JSON
+    back, with the stock DRF classes and the orjson backed ones. Returns
+    the results and whether both produced the same bytes and data.
+    """
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from core.parsers import FastJSONParser
+    from core.renderers import FastJSONRenderer
+    from recipe.mixins import plan_queryset
+    from recipe.serializers import FastRecipeSerializer
+
+    serializer = FastRecipeSerializer(many=True)
+    serializer.instance = plan_queryset(
+        Recipe.objects.filter(user_id=user_id).order_by('-id'), serializer)
+    data = serializer.data
+
+    outputs = {}
+    parsed = {}
+    results = {}
+    for name, renderer, parser in (
+            ('JSONRenderer', JSONRenderer(), JSONParser()),
+            ('FastJSONRenderer', FastJSONRenderer(), FastJSONParser())):
+        content = outputs[name] = renderer.render(data)
+        parsed[name] = parser.parse(io.BytesIO(content))
+        results[name] = summarize(
+            time_call(lambda: renderer.render(data), repeat))
+        results[parser.__class__.__name__] = summarize(time_call(
+            lambda: parser.parse(io.BytesIO(content)), repeat))
+    identical = (
+        len(set(outputs.values())) == 1
+        and parsed['JSONRenderer'] == parsed['FastJSONRenderer']
+    )
+    return results, len(outputs['JSONRenderer']), identical
+
+
+def _load_result(timings, elapsed):
+    durations = [duration for duration, _ in timings]
+    return {
+        'requests': len(timings),
+        'errors': sum(1 for _, ok in timings if not ok),
+        'throughput_rps': len(timings) / elapsed,
+        **summarize(durations),
+    }
+
+
+@contextmanager
+def query_latency(seconds):
+    """
+    Add seconds of latency to every query on connections opened in the
+    block, to load test against SQLite as if the database were remote.
+    """
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def add_delay(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    if not seconds:
+        yield
+        return
+    connection.close()
+    connection_created.connect(add_delay)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(add_delay)
+
+
+def _client_counts(requests, concurrency):
+    """Split requests between concurrency clients"""
+    return [
+        requests // concurrency + (client < requests % concurrency)
+        for client in range(min(concurrency, requests))
+    ]
+
+
+def load_test_wsgi(application, path, token, requests, concurrency,
+                   workers=10, client_delay=0):
+    """
+    Send requests to a WSGI application from concurrency clients, each
+    waiting for its previous response, served by a pool of workers threads
+    as a threaded WSGI server would. A client_delay in seconds keeps the
+    worker busy after the response, like writing to a slow client does.
+    """
+    def handle():
+        status = []
+        body = application({
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': allowed_host(),
+            'SERVER_PORT': '80',
+            'HTTP_HOST': allowed_host(),
+            'HTTP_AUTHORIZATION': 'Token ' + token,
+            'wsgi.input': io.BytesIO(),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': io.StringIO(),
+        }, lambda code, headers: status.append(code))
+        for _ in body:
+            time.sleep(client_delay)
+        body.close()
+        return status[0].startswith('200')
+
+    def client(count):
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            ok = server.submit(handle).result()
+            timings.append((time.perf_counter() - start, ok))
+        return timings
+
+    counts = _client_counts(requests, concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as server:
+        with ThreadPoolExecutor(max_workers=len(counts)) as clients:
+            timings = [
+                timing
+                for client_timings in clients.map(client, counts)
+                for timing in client_timings
+            ]
+    return _load_result(timings, time.perf_counter() - start)
+
+
+def load_test_asgi(application, path, token, requests, concurrency,
+                   client_delay=0):
+    """
+    Send requests to an ASGI application from concurrency clients, each
+    waiting for its previous response, on one event loop. A client_delay
+    in seconds is spent receiving the body.
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', allowed_host().encode()),
+            (b'authorization', ('Token ' + token).encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+
+    async def handle():
+        received = []
+        status = []
+
+        async def receive():
+            if received:
+                await asyncio.Future()
+            received.append(True)
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif client_delay:
+                await asyncio.sleep(client_delay)
+
+        await application(dict(scope), receive, send)
+        return status[0] == 200
+
+    async def client(count):
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            ok = await handle()
+            timings.append((time.perf_counter() - start, ok))
+        return timings
+
+    async def run():
+        return await asyncio.gather(*(
+            client(count) for count in _client_counts(requests, concurrency)
+        ))
+
+    start = time.perf_counter()
+    timings = [timing for timings in asyncio.run(run()) for timing in timings]
+    return _load_result(timings, time.perf_counter() - start)
+
+
+def api_scenarios(client, user):
+    """
+    Return {name: (url name, method, prepare, call, expected status)} for
+    every route of the recipe and user APIs.
+
+    prepare(i), when given, runs untimed before each call and its result
+    is passed to call, so writes that consume rows get fresh ones.
+    """
+    recipe_ids = list(
+        Recipe.objects.filter(user=user).order_by('-id')
+        .values_list('id', flat=True)[:50])
+    tag_names = list(
+        Tag.objects.filter(user=user).values_list('name', flat=True)[:3])
+    counter = iter(range(10 ** 9))
+
+    def recipe_payload(i):
+        return {
+            'title': f'Benchmark recipe {i}',
+            'time_minutes': 10,
+            'price': '4.50',
+            'tags': [{'name': name} for name in tag_names],
+        }
+
+    def new_recipes(count=1):
+        return [
+            Recipe.objects.create(
+                user=user, title='Disposable', time_minutes=1,
+                price=Decimal('1.00')).id
+            for _ in range(count)
+        ]
+
+    def new_tag(i):
+        return Tag.objects.create(
+            user=user, name=f'Disposable {next(counter)}').id
+
+    def detail(name, pk):
+        return reverse(name, args=[pk])
+
+    def pick(i):
+        return recipe_ids[i % len(recipe_ids)]
+
+    list_url = reverse('recipe:recipe-list')
+    bulk_url = reverse('recipe:recipe-bulk')
+    tags_url = reverse('recipe:tag-list')
+    me_url = reverse('user:me')
+    return {
+        'api_root': ('recipe:api-root', 'GET', None, lambda i: client.get(
+            reverse('recipe:api-root')), 200),
+        'recipe_list': ('recipe:recipe-list', 'GET', None, lambda i: (
+            client.get(list_url)), 200),
+        'recipe_list_filtered': (
+            'recipe:recipe-list', 'GET', None,
+            lambda i: client.get(
+                list_url, {'max_time': 200 + i, 'search': 'Recipe'}),
+            200),
+        'recipe_create': ('recipe:recipe-list', 'POST', None, lambda i: (
+            client.post(list_url, recipe_payload(i), format='json')), 201),
+        'recipe_detail': ('recipe:recipe-detail', 'GET', pick, lambda pk: (
+            client.get(detail('recipe:recipe-detail', pk))), 200),
+        'recipe_update': (
+            'recipe:recipe-detail', 'PUT', pick,
+            lambda pk: client.put(
+                detail('recipe:recipe-detail', pk),
+                recipe_payload(pk), format='json'),
+            200),
+        'recipe_partial_update': (
+            'recipe:recipe-detail', 'PATCH', pick,
+            lambda pk: client.patch(
+                detail('recipe:recipe-detail', pk),
+                {'title': f'Renamed {pk}'}, format='json'),
+            200),
+        'recipe_delete': (
+            'recipe:recipe-detail', 'DELETE', lambda i: new_recipes()[0],
+            lambda pk: client.delete(detail('recipe:recipe-detail', pk)),
+            204),
+        'recipe_bulk_create': (
+            'recipe:recipe-bulk', 'POST', None,
+            lambda i: client.post(
+                bulk_url, [recipe_payload(i) for _ in range(10)],
+                format='json'),
+            201),
+        'recipe_bulk_update': (
+            'recipe:recipe-bulk', 'PATCH', None,
+            lambda i: client.patch(
+                bulk_url,
+                [{'id': pk, 'time_minutes': 5 + i} for pk in recipe_ids[:10]],
+                format='json'),
+            200),
+        'recipe_bulk_delete': (
+            'recipe:recipe-bulk', 'DELETE', lambda i: new_recipes(10),
+            lambda ids: client.delete(bulk_url, ids, format='json'), 204),
+        'tag_list': ('recipe:tag-list', 'GET', None, lambda i: (
+            client.get(tags_url)), 200),
+        'tag_stats': ('recipe:tag-stats', 'GET', None, lambda i: (
+            client.get(reverse('recipe:tag-stats'), {'top': 5 + i % 5})),
+            200),
+        'tag_update': (
+            'recipe:tag-detail', 'PATCH', new_tag,
+            lambda pk: client.patch(
+                detail('recipe:tag-detail', pk),
+                {'name': f'Renamed {pk}'}, format='json'),
+            200),
+        'tag_delete': (
+            'recipe:tag-detail', 'DELETE', new_tag,
+            lambda pk: client.delete(detail('recipe:tag-detail', pk)), 204),
+        'user_create': (
+            'user:create', 'POST', None,
+            lambda i: client.post(reverse('user:create'), {
+                'email': f'bench-new-{next(counter)}@example.com',
+                'password': SEED_PASSWORD,
+                'name': 'New user',
+            }),
+            201),
+        'user_token': (
+            'user:token', 'POST', None,
+            lambda i: client.post(reverse('user:token'), {
+                'email': user.email,
+                'password': SEED_PASSWORD,
+            }),
+            200),
+        'user_me': ('user:me', 'GET', None, lambda i: (
+            client.get(me_url)), 200),
+        'user_me_update': (
+            'user:me', 'PATCH', None,
+            lambda i: client.patch(me_url, {'name': f'Name {i}'}), 200),
+    }
+
+
+def benchmark_api(user_id, repeat=20, names=None):
+    """
+    Time every API route through the full Django stack for one seeded
+    user, returning per route latency, throughput and queries per request.
+
+    Queries per request are the median over the repeats so one-off cache
+    misses do not count. All writes are rolled back afterwards.
+    """
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+    from recipe.mixins import response_cache
+    from user.authentication import token_cache
+
+    User = get_user_model()
+    results = {}
+    try:
+        with transaction.atomic():
+            user = User.objects.get(pk=user_id)
+            token, _ = Token.objects.get_or_create(user=user)
+            client = APIClient(HTTP_HOST=allowed_host())
+            client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+            scenarios = api_scenarios(client, user)
+            for name, scenario in scenarios.items():
+                if names and name not in names:
+                    continue
+                url_name, method, prepare, call, expected = scenario
+                durations = []
+                queries = []
+                for i in range(repeat):
+                    arg = prepare(i) if prepare else i
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        response = call(arg)
+                        durations.append(time.perf_counter() - start)
+                    if response.status_code != expected:
+                        raise BenchmarkError('%s returned %d: %s' % (
+                            name, response.status_code,
+                            response.content[:200]))
+                    queries.append(len(captured))
+                results[name] = {
+                    'route': url_name,
+                    'method': method,
+                    'queries': statistics.median_low(queries),
+                    'throughput_rps': len(durations) / sum(durations),
+                    **summarize(durations),
+                }
+            raise _Rollback
+    except _Rollback:
+        pass
+    finally:
+        # Versions rolled back with the data may be reused for other rows
+        response_cache.clear()
+        token_cache.clear()
+    return results
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def query_baseline(baselines):
+    """
+    Return the highest query count of each route across the baselines of
+    every vendor, or None when none is recorded.
+
+    Counts only differ between backends by features such as bulk inserts
+    returning ids, which save queries, so they bound the queries of a
+    backend without its own baseline.
+    """
+    counts = {}
+    for baseline in baselines.values():
+        for name, result in baseline.items():
+            counts[name] = max(counts.get(name, 0), result['queries'])
+    if not counts:
+        return None
+    return {name: {'queries': queries} for name, queries in counts.items()}
+
+
+def compare_to_baseline(results, baseline, tolerance=None):
+    """
+    Return a message for each route doing more queries per request than
+    baseline, or when tolerance is given, with a p50 latency more than
+    tolerance times the baseline p50.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append('%s: %d queries per request, baseline %d' % (
+                name, result['queries'], expected['queries']))
+        if tolerance and result['p50_ms'] > expected['p50_ms'] * tolerance:
+            regressions.append('%s: p50 %.2f ms, baseline %.2f ms' % (
+                name, result['p50_ms'], expected['p50_ms']))
+    return regressions
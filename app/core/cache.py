@@ -0,0 +1,88 @@
+"""
+In-process caching helpers
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache with a per entry time to live.
+
+    Entries past their ttl are treated as missing and least recently used
+    entries are evicted once max_size entries or, when set, max_bytes of
+    declared entry sizes are exceeded. Hits, misses and evictions are
+    counted for reporting.
+    """
+
+    def __init__(self, max_size=1024, ttl=60, max_bytes=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _pop(self, key=None):
+        if key is None:
+            _, (_, _, size) = self._data.popitem(last=False)
+        else:
+            _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None, size=0):
+        """Store value, size is its weight against max_bytes"""
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires, size)
+            self.bytes += size
+            while len(self._data) > self.max_size or (
+                    self.max_bytes is not None
+                    and self.bytes > self.max_bytes):
+                self._pop()
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,67 @@
+"""
+Defaults of the app's settings dicts, merged with the project settings
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+DEFAULTS = {
+    # Password hashing pool of core.hashers, hash costs default to Django's
+    'PASSWORD_HASHING': {
+        'WORKERS': 4,
+        'QUEUE': 32,
+        'WAIT': 1,
+    },
+    # Token to user resolution cache of CachedTokenAuthentication
+    'TOKEN_AUTH_CACHE': {
+        'MAX_SIZE': 10000,
+        'TTL': 300,
+        'LOCAL_TTL': 5,
+        'BACKEND': None,
+    },
+    # Rendered response cache of the recipe and tag read endpoints
+    'RESPONSE_CACHE': {
+        'MAX_ENTRIES': 5000,
+        'MAX_BYTES': 64 * 1024 * 1024,
+        'TTL': 300,
+    },
+    # Database backed job queue of core.jobs
+    'JOB_QUEUE': {
+        'LEASE': 300,
+        'POLL_INTERVAL': 1.0,
+        'MAX_ATTEMPTS': 3,
+        'RETRY_DELAY': 10,
+        'MAX_RETRY_DELAY': 3600,
+        'METRICS_TTL': 10,
+        'FILE_TTL': 7 * 24 * 3600,
+    },
+    # The /metrics endpoint
+    'METRICS': {
+        'ENABLED': True,
+        'TOKEN': None,
+    },
+    # Request instrumentation by core.middleware.PerformanceMiddleware
+    'PERFORMANCE': {
+        'SERVER_TIMING': True,
+        'DEFAULT_QUERY_BUDGET': None,
+        'QUERY_BUDGETS': {},
+    },
+}
+
+_merged = {}
+
+
+def get(name):
+    """
+    Return the settings dict name with the defaults for the keys it
+    leaves out. The merged dict is shared, callers must not change it.
+    """
+    if name not in _merged:
+        _merged[name] = {**DEFAULTS[name], **getattr(settings, name, {})}
+    return _merged[name]
+
+
+@receiver(setting_changed)
+def _reload(setting, **kwargs):
+    _merged.pop(setting, None)
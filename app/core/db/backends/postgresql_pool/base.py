@@ -0,0 +1,115 @@
+"""
+PostgreSQL backend handing out connections from a per process pool.
+
+Configured like django.db.backends.postgresql with an extra POOL entry:
+
+    'POOL': {
+        'MIN_SIZE': 1,          # connections kept open while idle
+        'MAX_SIZE': 10,         # connections per worker process
+        'TIMEOUT': 10,          # seconds to wait for a free connection
+        'MAX_IDLE': 300,        # seconds before idle connections are closed
+        'MAX_LIFETIME': 3600,   # seconds before a connection is replaced
+        'CHECK_INTERVAL': 30,   # idle seconds before a checkout is pinged
+    }
+
+Closing a Django connection, as happens at the end of every request with
+the default CONN_MAX_AGE of 0, returns it to the pool instead.
+"""
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+from core.db.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'MAX_IDLE': 300,
+    'MAX_LIFETIME': 3600,
+    'CHECK_INTERVAL': 30,
+}
+
+
+def _check(conn):
+    if conn.closed:
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    return True
+
+
+def _reset(conn):
+    """
+    Leave conn idle outside any transaction with a fresh session, raising
+    if it is broken. DISCARD ALL drops the SET parameters, temporary
+    tables, advisory locks and prepared statements of the previous user;
+    Django sets its session parameters again on checkout.
+    """
+    if conn.closed:
+        raise base.Database.InterfaceError('connection already closed')
+    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+    # DISCARD ALL cannot run inside a transaction block
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('DISCARD ALL')
+    finally:
+        conn.autocommit = autocommit
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    _pool = None
+
+    def _make_pool(self, conn_params):
+        options = {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+        pool = ConnectionPool(
+            lambda: self._connect_pooled(pool, conn_params),
+            min_size=options['MIN_SIZE'],
+            max_size=options['MAX_SIZE'],
+            timeout=options['TIMEOUT'],
+            max_idle=options['MAX_IDLE'],
+            max_lifetime=options['MAX_LIFETIME'],
+            check_interval=options['CHECK_INTERVAL'],
+            check=_check,
+            reset=_reset,
+        )
+        pool.isolation_level = None
+        return pool
+
+    def _connect_pooled(self, pool, conn_params):
+        connection = super().get_new_connection(conn_params)
+        pool.isolation_level = self.isolation_level
+        return connection
+
+    @base.async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = get_pool(
+            self.alias,
+            repr(sorted(conn_params.items())),
+            lambda: self._make_pool(conn_params),
+        )
+        try:
+            pool.fill()
+            connection = pool.getconn()
+        except PoolTimeout as exc:
+            raise base.Database.OperationalError(str(exc)) from exc
+        self._pool = pool
+        self.isolation_level = pool.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._pool.putconn(
+                    self.connection, discard=bool(self.connection.closed))
@@ -0,0 +1,224 @@
+"""
+Thread safe pool of database connections
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """No connection became free before the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Pool of at most max_size connections made by calling connect().
+
+    Checked out connections are health checked with check() when they have
+    been idle longer than check_interval seconds (every checkout when 0)
+    and replaced if the check fails. Returned connections are reset with
+    reset() and closed instead if that raises or they are older than
+    max_lifetime. Connections idle longer than max_idle are closed down to
+    min_size. Checkouts wait up to timeout seconds for a free connection.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=10,
+                 max_idle=300, max_lifetime=3600, check_interval=30,
+                 check=None, reset=None, close=None):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self._check = check or (lambda conn: True)
+        self._reset = reset or (lambda conn: None)
+        self._close = close or (lambda conn: conn.close())
+        self._idle = deque()
+        self._created = {}
+        self._cond = threading.Condition()
+        self.pid = os.getpid()
+        self.key = None
+        self.size = 0
+        self.waiting = 0
+        self.counters = dict.fromkeys((
+            'checkouts', 'connections_opened', 'connections_closed',
+            'health_check_failures', 'timeouts'), 0)
+        self.wait_seconds = 0.0
+
+    def getconn(self):
+        """Return a healthy connection, opening one if none is idle"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._prune()
+            while True:
+                if self._idle:
+                    conn, returned = self._idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        'No database connection free after %ss (max_size=%d)'
+                        % (self.timeout, self.max_size))
+                self.waiting += 1
+                waited = time.monotonic()
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    self.wait_seconds += time.monotonic() - waited
+            self.counters['checkouts'] += 1
+
+        if conn is not None and (
+                time.monotonic() - returned < self.check_interval
+                or self._healthy(conn)):
+            return conn
+        if conn is not None:
+            self._discard(conn, release=False)
+        return self._open()
+
+    def putconn(self, conn, discard=False):
+        """Return conn to the pool, closing it if broken or too old"""
+        if not discard:
+            age = time.monotonic() - self._created.get(id(conn), 0)
+            discard = age > self.max_lifetime
+        if not discard:
+            try:
+                self._reset(conn)
+            except Exception:
+                discard = True
+        if discard:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def fill(self):
+        """Open connections until min_size are idle or checked out"""
+        while True:
+            with self._cond:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            self.putconn(self._open())
+
+    def close(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Return a snapshot of the pool size and counters"""
+        with self._cond:
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': self.size - len(self._idle),
+                'waiting': self.waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'wait_seconds_total': self.wait_seconds,
+                **self.counters,
+            }
+
+    def _healthy(self, conn):
+        try:
+            if self._check(conn):
+                return True
+        except Exception:
+            pass
+        with self._cond:
+            self.counters['health_check_failures'] += 1
+        return False
+
+    def _open(self):
+        """Open a connection for a slot already counted in size"""
+        try:
+            conn = self.connect()
+        except BaseException:
+            with self._cond:
+                self.size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.counters['connections_opened'] += 1
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn, release=True):
+        """Close conn, freeing its slot unless it is being replaced"""
+        try:
+            self._close(conn)
+        except Exception:
+            pass
+        with self._cond:
+            self._created.pop(id(conn), None)
+            self.counters['connections_closed'] += 1
+            if release:
+                self.size -= 1
+                self._cond.notify()
+
+    def _prune(self):
+        """Close connections idle past max_idle, keeping min_size open"""
+        now = time.monotonic()
+        while (self._idle and self.size > self.min_size
+               and now - self._idle[0][1] > self.max_idle):
+            conn, _ = self._idle.popleft()
+            self.size -= 1
+            self.counters['connections_closed'] += 1
+            self._created.pop(id(conn), None)
+            try:
+                self._close(conn)
+            except Exception:
+                pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, key, factory):
+    """
+    Return the pool of this process for alias, creating it with factory().
+
+    The pool is replaced when key, describing the connection settings,
+    changes or when the process id does, so workers forked from a parent
+    that already connected never share its sockets.
+    """
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is not None and pool.key != key and pool.pid == os.getpid():
+            pool.close()
+        if pool is None or pool.key != key or pool.pid != os.getpid():
+            pool = _pools[alias] = factory()
+            pool.key = key
+    return pool
+
+
+def close_pools(alias=None):
+    """Close the idle connections of the pool for alias, or of every pool"""
+    with _pools_lock:
+        pools = [
+            pool for name, pool in _pools.items()
+            if alias is None or name == alias
+        ]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """Return the stats of each pool of this process by database alias"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items()}
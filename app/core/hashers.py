@@ -0,0 +1,112 @@
+"""
+Password hashers with configurable cost, run on a bounded worker pool
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+
+from core import conf
+
+
+class HashingBusy(Exception):
+    """Every hashing worker is busy and the queue is full"""
+
+
+_local = threading.local()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Return the (executor, slots) pair, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            options = conf.get('PASSWORD_HASHING')
+            _pool = (
+                ThreadPoolExecutor(
+                    max_workers=options['WORKERS'],
+                    thread_name_prefix='password-hash',
+                ),
+                threading.BoundedSemaphore(
+                    options['WORKERS'] + options['QUEUE']),
+            )
+    return _pool
+
+
+def _run(func, args):
+    _local.worker = True
+    return func(*args)
+
+
+def offload(func, *args):
+    """
+    Return func(*args) computed on the password hashing pool.
+
+    At most WORKERS hashes run at once and QUEUE more wait for a worker;
+    callers beyond that wait up to WAIT seconds for room, then HashingBusy
+    is raised so a burst of logins is shed rather than queued unbounded.
+    """
+    options = conf.get('PASSWORD_HASHING')
+    if not options['WORKERS'] or getattr(_local, 'worker', False):
+        return func(*args)
+    executor, slots = _get_pool()
+    if not slots.acquire(timeout=options['WAIT']):
+        raise HashingBusy('Password hashing queue is full.')
+    try:
+        future = executor.submit(_run, func, args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+
+def _cost(name, default):
+    return conf.get('PASSWORD_HASHING').get(name, default)
+
+
+class OffloadMixin:
+    """Compute encode() and verify() on the hashing pool"""
+
+    def encode(self, *args):
+        return offload(super().encode, *args)
+
+    def verify(self, password, encoded):
+        return offload(super().verify, password, encoded)
+
+
+class PBKDF2PasswordHasher(OffloadMixin, hashers.PBKDF2PasswordHasher):
+
+    @property
+    def iterations(self):
+        return _cost(
+            'PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class Argon2PasswordHasher(OffloadMixin, hashers.Argon2PasswordHasher):
+
+    @property
+    def time_cost(self):
+        return _cost(
+            'ARGON2_TIME_COST', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _cost(
+            'ARGON2_MEMORY_COST', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _cost(
+            'ARGON2_PARALLELISM', hashers.Argon2PasswordHasher.parallelism)
+
+
+class BCryptSHA256PasswordHasher(
+        OffloadMixin, hashers.BCryptSHA256PasswordHasher):
+
+    @property
+    def rounds(self):
+        return _cost(
+            'BCRYPT_ROUNDS', hashers.BCryptSHA256PasswordHasher.rounds)
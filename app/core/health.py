@@ -0,0 +1,49 @@
+"""
+Liveness and readiness checks cheap enough to back frequent probes
+"""
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+_migrated = set()
+
+
+def check_database(alias=DEFAULT_DB_ALIAS):
+    """Return None if the database answers a query, else the error"""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError as exc:
+        return str(exc) or exc.__class__.__name__
+    return None
+
+
+def check_migrations(alias=DEFAULT_DB_ALIAS):
+    """
+    Return None if every migration is applied, else the unapplied ones.
+
+    Migrations cannot be unapplied under a running process, so a success
+    is remembered and later calls do not read the migration files again.
+    """
+    if alias in _migrated:
+        return None
+    try:
+        executor = MigrationExecutor(connections[alias])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    except DatabaseError as exc:
+        return str(exc) or exc.__class__.__name__
+    if plan:
+        return 'Unapplied migrations: %s' % ', '.join(
+            '%s.%s' % (migration.app_label, migration.name)
+            for migration, _ in plan
+        )
+    _migrated.add(alias)
+    return None
+
+
+def readiness(alias=DEFAULT_DB_ALIAS):
+    """Return (ready, {check name: error or None})"""
+    checks = {'database': check_database(alias)}
+    if checks['database'] is None:
+        checks['migrations'] = check_migrations(alias)
+    return not any(checks.values()), checks
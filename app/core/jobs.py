@@ -0,0 +1,309 @@
+"""
+Database backed background job queue
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import (
+    DatabaseError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from core import conf
+from core.metrics import registry
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+tasks = {}
+
+
+class Task:
+    """A registered job function with its enqueueing options"""
+
+    def __init__(self, name, func, public=False, args_serializer=None,
+                 max_attempts=None):
+        self.name = name
+        self.func = func
+        self.public = public
+        self.args_serializer = args_serializer
+        self.max_attempts = max_attempts
+
+    def __call__(self, context, **args):
+        return self.func(context, **args)
+
+
+def task(name, public=False, args_serializer=None, max_attempts=None):
+    """
+    Register the decorated function as the job called name.
+
+    The function is called with a JobContext and the job arguments as
+    keywords and returns a JSON serializable result. Public tasks may be
+    enqueued through the API by any user, for themselves, with arguments
+    validated by args_serializer.
+    """
+    def register(func):
+        tasks[name] = Task(name, func, public, args_serializer, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, user=None, delay=0, **args):
+    """Queue a run of the task called name and return the Job"""
+    if name not in tasks:
+        raise KeyError('Unknown task %r' % name)
+    return Job.objects.create(
+        name=name,
+        user=user,
+        args=args,
+        max_attempts=(
+            tasks[name].max_attempts or conf.get('JOB_QUEUE')['MAX_ATTEMPTS']),
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+class JobStopped(Exception):
+    """The job was cancelled or its lease was taken over"""
+
+
+class JobContext:
+    """Handed to running tasks to report progress and keep their lease"""
+
+    def __init__(self, job, lease):
+        self.job = job
+        self.lease = lease
+
+    def progress(self, done, total=None):
+        """
+        Record progress and renew the lease. Raises JobStopped if the job
+        was cancelled or another worker took it over, so tasks stop at
+        their next report.
+        """
+        changes = {
+            'progress': done,
+            'leased_until': timezone.now() + timedelta(seconds=self.lease),
+        }
+        if total is not None:
+            changes['total'] = total
+        updated = Job.objects.filter(
+            pk=self.job.pk, status=Job.RUNNING, worker=self.job.worker,
+        ).update(**changes)
+        if not updated:
+            raise JobStopped()
+        for attr, value in changes.items():
+            setattr(self.job, attr, value)
+
+
+def _claimable(now):
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(
+        status=Job.RUNNING, leased_until__lt=now)
+
+
+def claim(worker, lease=None):
+    """
+    Lease the next due job to worker and return it, or None.
+
+    Jobs whose lease expired, because their worker died, are claimed
+    again as a new attempt. Candidates are locked with SKIP LOCKED where
+    supported so concurrent workers never wait on each other, and the
+    lease is taken with a conditional update so two workers can never
+    hold the same job.
+    """
+    lease = lease or conf.get('JOB_QUEUE')['LEASE']
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        _claimable(now), attempts__lt=F('max_attempts')
+    ).order_by('run_at', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        candidates = candidates.select_for_update(skip_locked=True)
+
+    with transaction.atomic():
+        for job in candidates[:10]:
+            leased = Job.objects.filter(
+                _claimable(now), pk=job.pk, attempts=job.attempts,
+            ).update(
+                status=Job.RUNNING,
+                worker=worker,
+                attempts=job.attempts + 1,
+                leased_until=now + timedelta(seconds=lease),
+                started=now,
+            )
+            if leased:
+                job.refresh_from_db()
+                return job
+    return None
+
+
+def reap():
+    """Fail running jobs whose lease expired on their last attempt"""
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        leased_until__lt=timezone.now(),
+        attempts__gte=F('max_attempts'),
+    ).update(
+        status=Job.FAILED,
+        error='Lease expired on the last attempt.',
+        finished=timezone.now(),
+    )
+
+
+def delete_files(max_age=None):
+    """
+    Delete the files of jobs that finished more than max_age seconds ago,
+    FILE_TTL by default, and return how many were deleted. Files are
+    named by the job's args, such as an upload it reads, or its result,
+    such as an export it wrote, under the 'file' key, which is dropped
+    so a deleted file is no longer offered for download.
+    """
+    if max_age is None:
+        max_age = conf.get('JOB_QUEUE')['FILE_TTL']
+    expired = Job.objects.filter(
+        Q(args__has_key='file') | Q(result__has_key='file'),
+        status__in=[Job.SUCCEEDED, Job.FAILED, Job.CANCELLED],
+        finished__lt=timezone.now() - timedelta(seconds=max_age),
+    ).only('id', 'args', 'result')
+    deleted = 0
+    for job in expired.iterator():
+        for field in ('args', 'result'):
+            value = getattr(job, field)
+            if not isinstance(value, dict) or 'file' not in value:
+                continue
+            # Such as uploads the job already deleted once done with them
+            if default_storage.exists(value['file']):
+                default_storage.delete(value['file'])
+                deleted += 1
+            setattr(job, field, {
+                key: item for key, item in value.items() if key != 'file'})
+        job.save(update_fields=['args', 'result'])
+    return deleted
+
+
+def _finish(job, **changes):
+    """
+    Store the outcome if job is still leased by its worker. If the
+    database fails the outcome is lost and the job runs again once its
+    lease expires, like a job whose worker died.
+    """
+    changes.setdefault('finished', timezone.now())
+    changes['leased_until'] = None
+    try:
+        return Job.objects.filter(
+            pk=job.pk, status=Job.RUNNING, worker=job.worker,
+        ).update(**changes)
+    except DatabaseError:
+        # The worker's close_old_connections() drops a broken connection
+        logger.exception('Job %d outcome could not be stored', job.pk)
+        return 0
+
+
+def run(job, lease=None):
+    """
+    Run a claimed job and store its result.
+
+    Failed attempts are queued again after an exponential backoff until
+    max_attempts is reached, then the job is failed with the traceback.
+    """
+    options = conf.get('JOB_QUEUE')
+    context = JobContext(job, lease or options['LEASE'])
+    try:
+        result = tasks[job.name](context, **job.args)
+    except JobStopped:
+        outcome = 'stopped'
+        logger.info('Job %d stopped', job.pk)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Job %d failed on attempt %d', job.pk, job.attempts)
+        if job.attempts < job.max_attempts:
+            outcome = 'retried'
+            delay = min(
+                options['RETRY_DELAY'] * 2 ** (job.attempts - 1),
+                options['MAX_RETRY_DELAY'])
+            _finish(
+                job, status=Job.QUEUED, error=error, finished=None,
+                run_at=timezone.now() + timedelta(seconds=delay))
+        else:
+            outcome = 'failed'
+            _finish(job, status=Job.FAILED, error=error)
+    else:
+        outcome = 'succeeded'
+        _finish(job, status=Job.SUCCEEDED, result=result, error='')
+    return outcome
+
+
+class Worker:
+    """Claim and run jobs one at a time until stopped"""
+
+    def __init__(self, name=None, lease=None, poll_interval=None):
+        options = conf.get('JOB_QUEUE')
+        self.name = name or '%s-%d' % (socket.gethostname(), os.getpid())
+        self.lease = lease or options['LEASE']
+        self.poll_interval = (
+            options['POLL_INTERVAL'] if poll_interval is None
+            else poll_interval)
+        self.stopping = False
+
+    def stop(self, *args):
+        """Finish the current job then return from run()"""
+        self.stopping = True
+
+    def run(self, burst=False):
+        """
+        Process jobs, sleeping poll_interval when the queue is empty. In
+        burst mode return instead once no job is due. Returns the number
+        of jobs run.
+        """
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            try:
+                job = claim(self.name, self.lease)
+            except DatabaseError:
+                # Keep polling through database restarts and lock timeouts
+                logger.exception('Worker %s could not claim a job', self.name)
+                connection.close()
+                time.sleep(self.poll_interval)
+                continue
+            if job is None:
+                reap()
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            run(job, self.lease)
+            processed += 1
+        return processed
+
+
+_job_gauges = {'expires': 0, 'gauges': {}}
+
+
+def _collect_jobs():
+    """Return the queued and running job counts, cached for METRICS_TTL"""
+    now = time.monotonic()
+    if now < _job_gauges['expires']:
+        return _job_gauges['gauges']
+    counts = Job.objects.filter(
+        status__in=[Job.QUEUED, Job.RUNNING]
+    ).values('status').annotate(count=Count('id')).order_by()
+    gauges = {
+        ('jobs', (('status', status),)): 0
+        for status in (Job.QUEUED, Job.RUNNING)
+    }
+    for row in counts:
+        gauges['jobs', (('status', row['status']),)] = row['count']
+    _job_gauges.update(
+        expires=now + conf.get('JOB_QUEUE')['METRICS_TTL'], gauges=gauges)
+    return gauges
+
+
+registry.register(_collect_jobs)
@@ -0,0 +1,238 @@
+"""
+Django command to benchmark the hot paths of the API
+"""
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core import benchmarks, renderers
+from core.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = 'Seed a dataset and benchmark the hot paths of the API.'
+
+    suites = ('queries', 'serializers', 'renderers', 'load', 'api')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=self.suites)
+        parser.add_argument(
+            '--seed-users', type=int, default=0,
+            help='Users to create before benchmarking.')
+        parser.add_argument(
+            '--recipes-per-user', type=int, default=1000)
+        parser.add_argument(
+            '--tags-per-user', type=int, default=20)
+        parser.add_argument(
+            '--sample-users', type=int, default=10,
+            help='Users sampled from the seeded dataset.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests sent per server in the load suite.')
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Clients in flight in the load suite.')
+        parser.add_argument(
+            '--wsgi-workers', type=int, default=10,
+            help='Worker threads of the WSGI server in the load suite.')
+        parser.add_argument(
+            '--client-delay', type=float, default=0,
+            help='Milliseconds each load suite client takes to read.')
+        parser.add_argument(
+            '--baseline', type=Path,
+            default=settings.BASE_DIR / 'benchmarks' / 'api-baseline.json',
+            help='Baseline file the api suite is compared against.')
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Record the api suite results as the new baseline.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0,
+            help='Fail when an api p50 exceeds the baseline by this '
+                 'factor, latency is not compared when 0.')
+        parser.add_argument(
+            '--query-latency', type=float, default=0,
+            help='Milliseconds added to each query in the load suite, '
+                 'to simulate a remote database.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        if options['seed_users']:
+            self.stdout.write('Seeding %d users with %d recipes each...' % (
+                options['seed_users'], options['recipes_per_user']))
+            benchmarks.seed_dataset(
+                options['seed_users'],
+                options['recipes_per_user'],
+                tags_per_user=options['tags_per_user'],
+            )
+
+        user_ids = list(
+            Recipe.objects.order_by('user_id')
+            .values_list('user_id', flat=True)
+            .distinct()[:options['sample_users']]
+        )
+        if not user_ids:
+            raise CommandError('No recipes to benchmark, use --seed-users.')
+
+        getattr(self, 'run_%s' % options['suite'])(user_ids, options)
+
+    def write_results(self, title, results, plans=False):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, result in results.items():
+            self.stdout.write(
+                '  %-22s p50 %8.3f ms  p99 %8.3f ms  mean %8.3f ms' % (
+                    name, result['p50_ms'], result['p99_ms'],
+                    result['mean_ms']))
+            if plans:
+                for line in result['plan'].splitlines():
+                    self.stdout.write('      ' + line)
+
+    def run_queries(self, user_ids, options):
+        """Time the per-user list and tag lookup queries"""
+        results = benchmarks.benchmark_queries(user_ids, options['repeat'])
+        self.write_results('With indexes', results, plans=True)
+
+        if connection.vendor != 'postgresql':
+            return
+        indexes = [
+            (model, next(
+                index
+                for index in model._meta.indexes + model._meta.constraints
+                if index.name == name
+            ))
+            for model, name in (
+                (Recipe, 'recipe_user_id_desc_idx'),
+                (Tag, 'tag_user_id_desc_idx'),
+                (Tag, 'tag_user_key_idx'),
+            )
+        ]
+        baseline = benchmarks.benchmark_queries_without(
+            indexes, user_ids, options['repeat'])
+        self.write_results('Without composite indexes', baseline, plans=True)
+        self.stdout.write(self.style.MIGRATE_HEADING('Speed up (p50)'))
+        for name, result in results.items():
+            self.stdout.write('  %-22s %8.1fx' % (
+                name, baseline[name]['p50_ms'] / result['p50_ms']))
+
+    def run_serializers(self, user_ids, options):
+        """Compare the recipe list serializers on the largest collection"""
+        user_id = max(
+            user_ids,
+            key=lambda pk: Recipe.objects.filter(user_id=pk).count(),
+        )
+        count = Recipe.objects.filter(user_id=user_id).count()
+        results, identical = benchmarks.benchmark_serializers(
+            user_id, options['repeat'])
+        self.write_results('Rendering %d recipes' % count, results)
+        self.stdout.write('  %-22s %8.1fx' % (
+            'speed up (p50)',
+            results['RecipeSerializer']['p50_ms']
+            / results['FastRecipeSerializer']['p50_ms']))
+        if not identical:
+            raise CommandError('Serializers rendered different output.')
+        self.stdout.write(self.style.SUCCESS('  Output is byte identical'))
+
+    def run_renderers(self, user_ids, options):
+        """Compare the stock and orjson JSON renderers and parsers"""
+        user_id = max(
+            user_ids,
+            key=lambda pk: Recipe.objects.filter(user_id=pk).count(),
+        )
+        results, size, identical = benchmarks.benchmark_renderers(
+            user_id, options['repeat'])
+        self.write_results('Rendering and parsing %d bytes' % size, results)
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING(
+                '  orjson is not installed, the fast classes fell back'))
+        self.stdout.write(self.style.MIGRATE_HEADING('Speed up (p50)'))
+        for stock, fast in (
+                ('JSONRenderer', 'FastJSONRenderer'),
+                ('JSONParser', 'FastJSONParser')):
+            self.stdout.write('  %-22s %8.1fx' % (
+                fast, results[stock]['p50_ms'] / results[fast]['p50_ms']))
+        if not identical:
+            raise CommandError('Renderers produced different output.')
+        self.stdout.write(self.style.SUCCESS('  Output is byte identical'))
+
+    def run_load(self, user_ids, options):
+        """Compare recipe list throughput under WSGI and ASGI"""
+        token, _ = Token.objects.get_or_create(user_id=user_ids[0])
+        sync_path = reverse('recipe:recipe-list')
+        async_path = reverse('recipe:async-recipe-list')
+        load = {
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'client_delay': options['client_delay'] / 1000,
+        }
+        with benchmarks.query_latency(options['query_latency'] / 1000):
+            results = {
+                'WSGI': benchmarks.load_test_wsgi(
+                    get_wsgi_application(), sync_path, token.key,
+                    workers=options['wsgi_workers'], **load),
+                'ASGI sync views': benchmarks.load_test_asgi(
+                    get_asgi_application(), sync_path, token.key, **load),
+                'ASGI async views': benchmarks.load_test_asgi(
+                    get_asgi_application(), async_path, token.key, **load),
+            }
+        self.write_results(
+            '%(requests)d requests, %(concurrency)d concurrent clients'
+            % options, results)
+        for name, result in results.items():
+            self.stdout.write('  %-22s %8.1f req/s  %d errors' % (
+                name, result['throughput_rps'], result['errors']))
+
+    def run_api(self, user_ids, options):
+        """Time every API route and compare with the baseline"""
+        try:
+            results = benchmarks.benchmark_api(
+                user_ids[0], options['repeat'])
+        except benchmarks.BenchmarkError as exc:
+            raise CommandError(exc)
+        self.write_results('API routes', results)
+        for name, result in results.items():
+            self.stdout.write('  %-22s %-6s %3d queries %8.1f req/s' % (
+                name, result['method'], result['queries'],
+                result['throughput_rps']))
+
+        path = options['baseline']
+        baselines = json.loads(path.read_text()) if path.exists() else {}
+        if options['save_baseline']:
+            baselines[connection.vendor] = {
+                name: {
+                    key: round(value, 3) if isinstance(value, float)
+                    else value
+                    for key, value in result.items()
+                }
+                for name, result in results.items()
+            }
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(
+                json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+            self.stdout.write('Baseline written to %s' % path)
+            return
+
+        baseline = baselines.get(connection.vendor)
+        tolerance = options['tolerance']
+        if baseline is None:
+            baseline = benchmarks.query_baseline(baselines)
+            if baseline is None:
+                raise CommandError('No baseline in %s' % path)
+            # Latencies of another backend say nothing about this one
+            tolerance = None
+            self.stdout.write(self.style.WARNING(
+                'No %s baseline in %s, comparing query counts only'
+                % (connection.vendor, path)))
+        regressions = benchmarks.compare_to_baseline(
+            results, baseline, tolerance)
+        if regressions:
+            raise CommandError(
+                'Regressions against %s:\n  %s'
+                % (path, '\n  '.join(regressions)))
+        self.stdout.write(self.style.SUCCESS('  No regressions'))
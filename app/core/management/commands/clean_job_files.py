@@ -0,0 +1,23 @@
+"""
+Django command to delete the files written by finished jobs
+"""
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete files written by jobs, such as exports, once they are '
+        'older than JOB_QUEUE FILE_TTL. Run it periodically.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Seconds since the job finished, instead of FILE_TTL.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        deleted = jobs.delete_files(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(
+            'Deleted %d job files' % deleted))
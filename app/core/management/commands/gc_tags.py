@@ -0,0 +1,36 @@
+"""
+Django command to delete tags no recipe uses
+"""
+from django.core.management.base import BaseCommand
+
+from recipe import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete tags without recipes in short batches, optionally merging '
+        'tags whose names only differ in case and whitespace first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=bulk.BATCH_SIZE,
+            help='Tags locked and deleted per transaction.')
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Only collect the tags of this user id, repeatable.')
+        parser.add_argument(
+            '--merge-duplicates', action='store_true',
+            help='Merge tags sharing a normalized name into the oldest.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        if options['merge_duplicates']:
+            merged = bulk.merge_duplicate_tags(options['users'])
+            self.stdout.write('Merged %d duplicate tags' % merged)
+        deleted = 0
+        for count in bulk.delete_unused_tags(
+                options['batch_size'], options['users']):
+            deleted += count
+            self.stdout.write('Deleted %d unused tags' % deleted)
+        self.stdout.write(self.style.SUCCESS(
+            'Deleted %d unused tags in total' % deleted))
@@ -0,0 +1,27 @@
+"""
+Django command to recompute the recipe counts of tags
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Tag
+
+
+class Command(BaseCommand):
+    help = 'Recount the recipes of every tag, fixing drifted counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Tags locked and recounted per transaction.')
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Only recount the tags of this user id, repeatable.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        tags = Tag.objects.all()
+        if options['users']:
+            tags = tags.filter(user_id__in=options['users'])
+        fixed = Tag.objects.recount(tags, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Fixed %d tag counts' % fixed))
@@ -0,0 +1,67 @@
+"""
+Django command to run background jobs from the database queue
+"""
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+def _work(options):
+    worker = jobs.Worker(
+        lease=options['lease'], poll_interval=options['poll_interval'])
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.run(burst=options['burst'])
+
+
+class Command(BaseCommand):
+    help = 'Run queued jobs in one or more worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Worker processes, each running one job at a time.')
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no job is due instead of polling.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=None,
+            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument(
+            '--lease', type=int, default=None,
+            help='Seconds a job stays leased without progress reports.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        processes = max(1, options['processes'])
+        self.stdout.write('Starting %d worker process%s' % (
+            processes, '' if processes == 1 else 'es'))
+        if processes == 1:
+            processed = _work(options)
+            self.stdout.write('Ran %d jobs' % processed)
+            return
+
+        # Children must open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(target=_work, args=(options,), daemon=False)
+            for _ in range(processes)
+        ]
+        for child in children:
+            child.start()
+
+        def forward(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    child.terminate()
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, forward)
+        for child in children:
+            child.join()
+        self.stdout.write('Workers stopped')
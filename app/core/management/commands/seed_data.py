@@ -0,0 +1,77 @@
+"""
+Django command to load large datasets of users, tags and recipes
+"""
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate, or import from CSV files, users with tags and tagged '
+        'recipes in streaming batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0)
+        parser.add_argument('--recipes-per-user', type=int, default=100)
+        parser.add_argument('--tags-per-user', type=int, default=20)
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Prefix of the generated user emails.')
+        parser.add_argument(
+            '--import', dest='directory', type=Path,
+            help='Directory of <table>.csv files to load instead.')
+        parser.add_argument(
+            '--batch-size', type=int, default=seeding.BATCH_SIZE,
+            help='Rows buffered per table before each write.')
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Use bulk_create even on PostgreSQL.')
+        parser.add_argument(
+            '--keep-indexes', action='store_true',
+            help='Maintain indexes while loading instead of rebuilding.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        directory = options['directory']
+        if directory is None and not options['users']:
+            raise CommandError('Pass --users or --import.')
+        if directory is not None and not directory.is_dir():
+            raise CommandError('%s is not a directory.' % directory)
+
+        use_copy = None if not options['no_copy'] else False
+        loader = seeding.Loader(
+            seeding.get_writer(use_copy), options['batch_size'])
+        models = [] if options['keep_indexes'] else seeding.seed_models()
+        start = time.perf_counter()
+        with seeding.deferred_indexes(models) as deferred:
+            if deferred:
+                self.stdout.write(
+                    'Deferred %d indexes until loaded.' % len(deferred))
+            if directory is not None:
+                counts = seeding.import_csv(directory, loader, use_copy)
+            else:
+                seeding.generate(
+                    loader,
+                    options['users'],
+                    options['recipes_per_user'],
+                    tags_per_user=options['tags_per_user'],
+                    tags_per_recipe=options['tags_per_recipe'],
+                    prefix=options['prefix'],
+                )
+                counts = loader.counts
+        if directory is not None:
+            seeding.fill_tags()
+        elapsed = time.perf_counter() - start
+
+        total = sum(counts.values())
+        for model, count in counts.items():
+            self.stdout.write('  %-30s %10d rows' % (
+                model._meta.db_table, count))
+        self.stdout.write(self.style.SUCCESS(
+            'Loaded %d rows in %.1fs (%d rows/s)' % (
+                total, elapsed, total / elapsed if elapsed else total)))
@@ -1,23 +1,64 @@
 """
 Django command to wait for db to be available
 """
+import random
 import time
 from psycopg2 import OperationalError as Psycop2Error
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from core import health
 
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Seconds to wait before giving up, 0 waits forever.')
+        parser.add_argument(
+            '--initial-delay', type=float, default=0.1,
+            help='Seconds before the first retry.')
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='Longest delay between retries.')
+        parser.add_argument(
+            '--migrations', action='store_true',
+            help='Also wait until all migrations are applied.')
+
     def handle(self, *args, **options):
         """Entry point for command"""
         self.stdout.write('Waiting for db to be available...')
-        db_up = False
-        while not db_up:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Psycop2Error, OperationalError):
-                self.stdout.write('db unavailable waiting 1 sec ...')
-                time.sleep(1)
+        deadline = None
+        if options['timeout']:
+            deadline = time.monotonic() + options['timeout']
+        delay = options['initial_delay']
+
+        while True:
+            error = self._unavailable(options['migrations'])
+            if error is None:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise CommandError(
+                    'Database unavailable after %ss: %s'
+                    % (options['timeout'], error))
+            # Full jitter keeps restarting containers from retrying in step
+            sleep = random.uniform(0, delay)
+            if deadline is not None:
+                sleep = min(sleep, max(0, deadline - time.monotonic()))
+            self.stdout.write(
+                '%s, retrying in %.2f sec ...' % (error, sleep))
+            time.sleep(sleep)
+            delay = min(delay * 2, options['max_delay'])
+
         self.stdout.write(self.style.SUCCESS('Database available!'))
+
+    def _unavailable(self, migrations):
+        """Return why the database is not usable yet, or None"""
+        try:
+            self.check(databases=['default'])
+        except (Psycop2Error, OperationalError):
+            return 'db unavailable'
+        if migrations:
+            return health.check_migrations()
+        return None
@@ -0,0 +1,198 @@
+"""
+Per process request metrics rendered in the Prometheus text format
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from core.db.pool import pool_stats
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings gathered while one request is handled"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.timings = defaultdict(float)
+
+    def add(self, name, seconds):
+        self.timings[name] += seconds
+
+
+def current():
+    """Return the RequestMetrics being gathered, if any"""
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Gather the timings of the block into a new RequestMetrics"""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Add the duration of the block to the current request's timings"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.add('db', time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def _instrument_connection(sender, connection, **kwargs):
+    """Time queries on every connection, whichever thread opened it"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class TimedSerializerMixin:
+    """Count the time spent building serializer.data as 'serializer'"""
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class Registry:
+    """Thread safe counters and histograms keyed by label values"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.collectors = []
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            buckets, total = self.histograms.get(
+                (name, labels), ([0] * len(DURATION_BUCKETS), [0, 0.0]))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            total[0] += 1
+            total[1] += value
+            self.histograms[name, labels] = (buckets, total)
+
+    def register(self, collector):
+        """Add a callable returning {(name, labels): value} gauges"""
+        self.collectors.append(collector)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (list(buckets), list(total)))
+                for key, (buckets, total) in self.histograms.items()
+            )
+        gauges = {}
+        for collector in self.collectors:
+            gauges.update(collector())
+
+        lines = []
+        for kind, samples in (
+                ('counter', counters), ('gauge', sorted(gauges.items()))):
+            typed = set()
+            for (name, labels), value in samples:
+                if name not in typed:
+                    lines.append('# TYPE %s %s' % (name, kind))
+                    typed.add(name)
+                lines.append('%s%s %s' % (
+                    name, _labels(labels), _number(value)))
+        typed = set()
+        for (name, labels), (buckets, (count, total)) in histograms:
+            if name not in typed:
+                lines.append('# TYPE %s histogram' % name)
+                typed.add(name)
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                lines.append('%s_bucket%s %d' % (
+                    name, _labels(labels + (('le', _number(bound)),)),
+                    bucket))
+            lines.append('%s_bucket%s %d' % (
+                name, _labels(labels + (('le', '+Inf'),)), count))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), total))
+            lines.append('%s_count%s %d' % (name, _labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"')) for key, value in labels)
+
+
+def _number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+registry = Registry()
+
+
+def register_cache(name, cache):
+    """Expose the counters of an LRUCache as gauges"""
+    def collect_cache():
+        return {
+            ('cache_' + key, (('cache', name),)): value
+            for key, value in cache.stats().items()
+            if value is not None
+        }
+    registry.register(collect_cache)
+
+
+def _collect_db_pools():
+    return {
+        ('db_pool_' + key, (('alias', alias),)): value
+        for alias, stats in pool_stats().items()
+        for key, value in stats.items()
+    }
+
+
+registry.register(_collect_db_pools)
@@ -0,0 +1,135 @@
+"""
+Request performance instrumentation
+"""
+import asyncio
+import logging
+import time
+
+from django.http import HttpResponse
+
+from core import conf, metrics
+from core.hashers import HashingBusy
+
+
+logger = logging.getLogger(__name__)
+
+
+class PerformanceMiddleware:
+    """
+    Record wall time, database queries and time, serializer and render
+    time and response size of every request.
+
+    Totals per view and method are kept in core.metrics.registry for the
+    metrics endpoint, the request's own figures are returned in a
+    Server-Timing header, and requests running more queries than the
+    budget for their method and view ('GET recipe:recipe-list'), else for
+    their view, are logged and counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as async the way MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with metrics.collect() as timings:
+            response = self.get_response(request)
+            self.record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        with metrics.collect() as timings:
+            response = await self.get_response(request)
+            self.record(request, response, timings)
+        return response
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+        timings = metrics.current()
+
+        def rendered(response):
+            if timings is not None:
+                timings.add('render', time.perf_counter() - start)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, request, response, timings):
+        options = conf.get('PERFORMANCE')
+        total = time.perf_counter() - timings.start
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        labels = (('view', view), ('method', request.method))
+        size = 0 if response.streaming else len(response.content)
+
+        registry = metrics.registry
+        registry.inc('http_requests_total', labels + (
+            ('status', response.status_code),))
+        registry.observe('http_request_duration_seconds', labels, total)
+        registry.inc('http_db_queries_total', labels, timings.queries)
+        for name in ('db', 'serializer', 'render'):
+            registry.inc(
+                'http_%s_seconds_total' % name, labels,
+                timings.timings[name])
+        registry.inc('http_response_bytes_total', labels, size)
+
+        budgets = options['QUERY_BUDGETS']
+        budget = budgets.get(
+            '%s %s' % (request.method, view),
+            budgets.get(view, options['DEFAULT_QUERY_BUDGET']))
+        if budget is not None and timings.queries > budget:
+            registry.inc('http_query_budget_exceeded_total', labels)
+            logger.warning(
+                '%s %s ran %d queries, budget is %d',
+                request.method, request.path, timings.queries, budget)
+
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = ', '.join([
+                'db;dur=%.2f;desc="%d queries"' % (
+                    timings.timings['db'] * 1000, timings.queries),
+                'serializer;dur=%.2f' % (
+                    timings.timings['serializer'] * 1000),
+                'render;dur=%.2f' % (timings.timings['render'] * 1000),
+                'total;dur=%.2f' % (total * 1000),
+            ])
+
+
+class HashingBusyMiddleware:
+    """
+    Answer 503 with Retry-After when the password hashing pool sheds load
+    outside the API views handling it themselves, such as the admin login.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Sync only, it would put every ASGI request on one thread
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingBusy):
+            return None
+        response = HttpResponse(
+            'Too many password checks in progress, retry shortly.',
+            content_type='text/plain; charset=utf-8',
+            status=503,
+        )
+        response['Retry-After'] = '1'
+        return response
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:49
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """Fold duplicate (user, name) tags into the oldest one."""
+    Tag = apps.get_model('core', 'Tag')
+    RecipeTag = apps.get_model('core', 'Recipe').tags.through
+
+    duplicates = (
+        Tag.objects.values('user_id', 'name')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        drop_ids = list(
+            Tag.objects.filter(
+                user_id=duplicate['user_id'],
+                name=duplicate['name'],
+            ).exclude(id=duplicate['keep_id']).values_list('id', flat=True)
+        )
+        recipe_ids = set(
+            RecipeTag.objects.filter(tag_id__in=drop_ids)
+            .values_list('recipe_id', flat=True)
+        )
+        RecipeTag.objects.bulk_create(
+            [
+                RecipeTag(recipe_id=recipe_id, tag_id=duplicate['keep_id'])
+                for recipe_id in recipe_ids
+            ],
+            ignore_conflicts=True,
+        )
+        Tag.objects.filter(id__in=drop_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_auto_20221214_1304'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# Django compares icontains as UPPER(column::text) LIKE UPPER(pattern) on
+# PostgreSQL, so the trigram indexes are built over that same expression.
+SEARCH_INDEXES = {
+    'recipe_title_trgm_idx': 'title',
+    'recipe_description_trgm_idx': 'description',
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in SEARCH_INDEXES.items():
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s ON core_recipe '
+            'USING gin (UPPER(%s::text) gin_trgm_ops)' % (name, column)
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEARCH_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_user_ordering_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
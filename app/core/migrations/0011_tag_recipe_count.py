@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:37
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_tag_recipes(apps, schema_editor):
+    """Fill in the recipe counts of existing tags."""
+    Tag = apps.get_model('core', 'Tag')
+    RecipeTag = apps.get_model('core', 'Recipe').tags.through
+    counts = (
+        RecipeTag.objects.filter(tag_id=OuterRef('pk'))
+        .order_by()
+        .values('tag_id')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Tag.objects.update(recipe_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_tag_recipes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='tag_user_popular_idx'),
+        ),
+    ]
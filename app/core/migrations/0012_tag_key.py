@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+def fill_tag_keys(apps, schema_editor):
+    """Compute the normalized key of existing tags."""
+    Tag = apps.get_model('core', 'Tag')
+    tags = Tag.objects.only('id', 'name').order_by('id')
+    batch = []
+    for tag in tags.iterator():
+        tag.key = ' '.join(tag.name.split()).casefold()
+        batch.append(tag)
+        if len(batch) == 1000:
+            Tag.objects.bulk_update(batch, ['key'])
+            batch = []
+    Tag.objects.bulk_update(batch, ['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tag_recipe_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='key',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_tag_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'key'], name='tag_user_key_idx'),
+        ),
+    ]
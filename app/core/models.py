@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import (
     BaseUserManager,
     AbstractBaseUser,
@@ -6,6 +6,7 @@ from django.contrib.auth.models import (
 )
 
 from django.conf import settings
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -65,16 +66,292 @@ class Recipe(models.Model):
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='recipe_user_id_desc_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+def tag_key(name):
+    """Return the case and whitespace insensitive key of a tag name"""
+    return ' '.join(name.split()).casefold()
+
+
+class TagManager(models.Manager):
+    def get_or_create_many(self, user, names):
+        """
+        Return a dict of name to Tag for user, creating missing tags.
+
+        Names are matched on their tag_key(), so "vegan " finds the
+        existing "Vegan" tag, the oldest one if several share the key.
+        Existing tags are fetched in one query and missing ones are
+        inserted in one statement. Conflicting inserts from concurrent
+        writers are ignored thanks to the unique (user, name) constraint
+        and the winners are read back.
+        """
+        keys = {name: tag_key(name) for name in names}
+        if not keys:
+            return {}
+
+        tags = {}
+        for tag in self.filter(
+                user=user, key__in=set(keys.values())).order_by('id'):
+            tags.setdefault(tag.key, tag)
+        missing = {}
+        for name, key in keys.items():
+            if key not in tags:
+                missing.setdefault(key, name)
+        if missing:
+            self.bulk_create(
+                [
+                    self.model(user=user, name=name, key=key)
+                    for key, name in missing.items()
+                ],
+                ignore_conflicts=True,
+            )
+            for tag in self.filter(
+                    user=user, key__in=missing).order_by('id'):
+                tags.setdefault(tag.key, tag)
+        return {name: tags[key] for name, key in keys.items()}
+
+    def fill_keys(self, batch_size=1000):
+        """
+        Set the key of tags written without one, such as rows loaded
+        straight into the table, batch_size at a time.
+        """
+        while True:
+            tags = list(self.filter(key='').only('id', 'name')[:batch_size])
+            if not tags:
+                return
+            for tag in tags:
+                tag.key = tag_key(tag.name)
+            self.bulk_update(tags, ['key'])
+
+    def adjust_counts(self, deltas):
+        """
+        Add deltas, a mapping of tag id to change, to the recipe counts
+        of those tags in one statement.
+        """
+        deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self.filter(id__in=deltas).update(
+            recipe_count=models.F('recipe_count') + models.Case(
+                *[
+                    models.When(id=tag_id, then=models.Value(delta))
+                    for tag_id, delta in deltas.items()
+                ],
+                output_field=models.IntegerField(),
+            )
+        )
+
+    def recount(self, queryset=None, batch_size=1000):
+        """
+        Correct the recipe counts of the tags in queryset, all tags by
+        default, from the recipe links. Tags are locked and recounted
+        batch_size at a time, each batch in its own short transaction, so
+        concurrent writers are never blocked for long and no increment
+        they make is lost. Returns how many counts were wrong.
+        """
+        queryset = self.all() if queryset is None else queryset
+        fixed = 0
+        last = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    queryset.filter(pk__gt=last).order_by('pk')
+                    .select_for_update().values_list('pk', flat=True)
+                    [:batch_size]
+                )
+                if not ids:
+                    return fixed
+                last = ids[-1]
+                wrong = dict(
+                    self.filter(pk__in=ids)
+                    .annotate(actual=models.Count('recipe'))
+                    .exclude(recipe_count=models.F('actual'))
+                    .order_by()
+                    .values_list('pk', 'actual')
+                )
+                if wrong:
+                    self.filter(pk__in=wrong).update(
+                        recipe_count=models.Case(
+                            *[
+                                models.When(pk=pk, then=models.Value(actual))
+                                for pk, actual in wrong.items()
+                            ],
+                            output_field=models.IntegerField(),
+                        ))
+                fixed += len(wrong)
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete= models.CASCADE
     )
+    # tag_key() of the name, set on save, for finding near duplicates
+    key = models.CharField(max_length=255, blank=True, editable=False)
+    # Number of recipes with the tag, kept current by core.signals and the
+    # bulk write paths, repaired by the repair_tag_counts command
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = TagManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='tag_user_id_desc_idx',
+            ),
+            models.Index(
+                fields=['user', '-recipe_count', 'id'],
+                name='tag_user_popular_idx',
+            ),
+            models.Index(
+                fields=['user', 'key'],
+                name='tag_user_key_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.key = tag_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'key'}
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+class CollectionVersionManager(models.Manager):
+    def current(self, user):
+        """
+        Return (version, modified) for the user's collection, or (0, None)
+        if it has never been written to.
+        """
+        return self.filter(user=user).values_list(
+            'version', 'modified').first() or (0, None)
+
+    def bump(self, user):
+        """Record a change to the recipes or tags of a user or user id."""
+        user_id = getattr(user, 'pk', user)
+        changes = {'version': models.F('version') + 1,
+                   'modified': timezone.now()}
+        if self.filter(user_id=user_id).update(**changes):
+            return
+        _, created = self.get_or_create(user_id=user_id)
+        if not created:
+            self.filter(user_id=user_id).update(**changes)
+
+
+class CollectionVersion(models.Model):
+    """Version of a user's recipes and tags, bumped on every write"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    version = models.PositiveBigIntegerField(default=1)
+    modified = models.DateTimeField(default=timezone.now)
+
+    objects = CollectionVersionManager()
+
+    def __str__(self):
+        return '%s v%d' % (self.user_id, self.version)
+
+
+class RecipeImport(models.Model):
+    """Progress of a streamed recipe import, committed batch by batch"""
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=RUNNING)
+    rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return 'Import %d (%s, %d rows)' % (self.pk, self.status, self.rows)
+
+
+class Job(models.Model):
+    """Unit of background work run by the run_worker command"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    # Jobs outlive the account they delete
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=255, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    progress = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at'],
+                name='job_status_run_at_idx',
+            ),
+            models.Index(
+                fields=['user', '-id'],
+                name='job_user_id_desc_idx',
+            ),
+        ]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return '%s #%d (%s)' % (self.name, self.pk, self.status)
@@ -0,0 +1,38 @@
+"""
+JSON parser decoding with orjson when it is installed
+"""
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework import parsers
+
+from core.renderers import FastJSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser decoding UTF-8 bodies with orjson. Bodies orjson rejects
+    are parsed again by the stock parser, so documents only json accepts
+    still load and errors keep their usual messages. Other encodings,
+    non-strict JSON and installs without orjson use the stock parser.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if (orjson is None or not self.strict
+                or codecs.lookup(encoding).name != 'utf-8'):
+            return super().parse(stream, media_type, parser_context)
+        content = stream.read()
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return super().parse(
+                io.BytesIO(content), media_type, parser_context)
@@ -0,0 +1,72 @@
+"""
+JSON renderer encoding with orjson when it is installed
+"""
+import math
+
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _has_non_finite(data):
+    """Return whether data holds a NaN or infinite float"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer encoding with orjson, several times faster than the
+    json module on large pages.
+
+    Output matches the stock renderer with the default compact, unicode
+    settings: types orjson does not handle itself, such as Decimal, dates
+    and lazy strings, go through the same JSONEncoder, and U+2028 and
+    U+2029 are escaped alike. Indented or ASCII output, data orjson
+    rejects or holding non-finite floats, which orjson would render as
+    null, and installs without orjson use the stock renderer.
+    """
+    # Dates are passed to JSONEncoder so they keep its format
+    orjson_options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if orjson is not None else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=self.orjson_options,
+            )
+        except orjson.JSONEncodeError:
+            # Such as integers beyond 64 bits, which json handles
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        # orjson writes NaN and infinities as null, json rejects them
+        if b'null' in content and _has_non_finite(data):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(
+                b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
+        return content
@@ -0,0 +1,281 @@
+"""
+Bulk loading of users, recipes, tags and their links
+"""
+import csv
+import io
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from core.models import Recipe, Tag
+
+
+SEED_PASSWORD = 'benchpass123'
+BATCH_SIZE = 5000
+
+
+def seed_models():
+    """Return the seeded models, parents before children"""
+    return [get_user_model(), Tag, Recipe, Recipe.tags.through]
+
+
+class BulkCreateWriter:
+    """Insert rows with bulk_create, one transaction per flush"""
+
+    def write(self, model, rows):
+        model.objects.bulk_create(
+            [model(**row) for row in rows], batch_size=BATCH_SIZE)
+
+
+class CopyWriter:
+    """Insert rows with PostgreSQL COPY, one transaction per flush"""
+
+    def write(self, model, rows):
+        fields = model._meta.concrete_fields
+        buffer = io.StringIO()
+        # Strings are quoted so empty ones are not read back as NULL
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for row in rows:
+            writer.writerow([
+                row[field.attname] if field.attname in row
+                else field.get_default()
+                for field in fields
+            ])
+        buffer.seek(0)
+        copy_from(model, [field.column for field in fields], buffer)
+
+
+def copy_from(model, columns, file, header=False):
+    """Stream CSV from file into the model's table, returning the rows"""
+    sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv%s)' % (
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', HEADER' if header else '',
+    )
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(sql, file)
+        return cursor.cursor.rowcount
+
+
+def copy_csv(model, file, columns):
+    """
+    Stream a CSV file with a header row naming columns into the model's
+    table with COPY, returning the rows. The tables have no database
+    defaults, so for the COPY the columns the file leaves out get the
+    defaults of their fields, the empty string for blank ones.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    missing = [
+        field for field in model._meta.concrete_fields
+        if field.column not in columns and not field.primary_key
+        and (field.has_default() or field.blank) and not field.null
+    ]
+    with connection.cursor() as cursor:
+        for field in missing:
+            cursor.execute(
+                'ALTER TABLE %s ALTER COLUMN %s SET DEFAULT %%s' % (
+                    table, connection.ops.quote_name(field.column)),
+                [field.get_db_prep_save(field.get_default(), connection)])
+        rows = copy_from(model, columns, file, header=True)
+        for field in missing:
+            cursor.execute('ALTER TABLE %s ALTER COLUMN %s DROP DEFAULT' % (
+                table, connection.ops.quote_name(field.column)))
+    return rows
+
+
+def get_writer(use_copy=None):
+    """Return the COPY writer on PostgreSQL, else the bulk_create one"""
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    return CopyWriter() if use_copy else BulkCreateWriter()
+
+
+class Loader:
+    """
+    Buffer rows per model and flush them all, parents first, in one
+    transaction whenever any buffer reaches batch_size rows.
+    """
+
+    def __init__(self, writer, batch_size=BATCH_SIZE):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.models = seed_models()
+        self.buffers = {model: [] for model in self.models}
+        self.counts = {model: 0 for model in self.models}
+
+    def add(self, model, row):
+        buffer = self.buffers[model]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with transaction.atomic():
+            for model in self.models:
+                rows = self.buffers[model]
+                if rows:
+                    self.writer.write(model, rows)
+                    self.counts[model] += len(rows)
+                    self.buffers[model] = []
+
+
+def next_id(model):
+    return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+def reset_sequences():
+    """Move the id sequences past explicitly inserted ids"""
+    statements = connection.ops.sequence_reset_sql(no_style(), seed_models())
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+@contextmanager
+def deferred_indexes(models):
+    """
+    Drop the plain indexes of the models' tables while the block loads
+    data and rebuild them afterwards, which is much faster than updating
+    them row by row. Indexes backing constraints are kept. Only done on
+    PostgreSQL, elsewhere the block runs unchanged.
+    """
+    if connection.vendor != 'postgresql':
+        yield []
+        return
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT indexname, indexdef FROM pg_indexes i
+            WHERE schemaname = current_schema() AND tablename = ANY(%s)
+            AND NOT EXISTS (
+                SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname
+            )
+            """,
+            [tables],
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute('DROP INDEX %s' % connection.ops.quote_name(name))
+    try:
+        yield [name for name, _ in indexes]
+    finally:
+        with connection.cursor() as cursor:
+            for _, definition in indexes:
+                cursor.execute(definition)
+            for table in tables:
+                cursor.execute('ANALYZE %s' % connection.ops.quote_name(table))
+
+
+def generate(loader, users, recipes_per_user, tags_per_user=20,
+             tags_per_recipe=3, prefix='seed', password=SEED_PASSWORD):
+    """
+    Stream generated users with tags and tagged recipes into loader.
+
+    Ids are allocated up front from the current maxima so no row has to
+    be read back. All users share one pre-computed password hash so
+    seeding is not bound by the password hasher. Returns the user ids.
+    """
+    User, RecipeTag = get_user_model(), Recipe.tags.through
+    password = make_password(password)
+    user_id, tag_id, recipe_id, link_id = (
+        next_id(model) for model in (User, Tag, Recipe, RecipeTag))
+    links = min(tags_per_recipe, tags_per_user)
+    user_ids = []
+    # Every user gets the same links, so their tags share recipe counts
+    recipe_counts = Counter(
+        (i + n) % tags_per_user
+        for i in range(recipes_per_user) for n in range(links)
+    )
+
+    for _ in range(users):
+        user_ids.append(user_id)
+        loader.add(User, {
+            'id': user_id,
+            'email': f'{prefix}{user_id}@example.com',
+            'name': f'{prefix} user {user_id}',
+            'password': password,
+        })
+        for i in range(tags_per_user):
+            loader.add(Tag, {
+                'id': tag_id + i, 'user_id': user_id, 'name': f'Tag {i}',
+                'key': f'tag {i}', 'recipe_count': recipe_counts[i]})
+        for i in range(recipes_per_user):
+            loader.add(Recipe, {
+                'id': recipe_id,
+                'user_id': user_id,
+                'title': f'Recipe {i}',
+                'description': f'Description of recipe {i}',
+                'time_minutes': 5 + i % 120,
+                'price': Decimal(i % 9000) / 100,
+                'link': f'https://example.com/recipe/{i}',
+            })
+            for n in range(links):
+                loader.add(RecipeTag, {
+                    'id': link_id,
+                    'recipe_id': recipe_id,
+                    'tag_id': tag_id + (i + n) % tags_per_user,
+                })
+                link_id += 1
+            recipe_id += 1
+        tag_id += tags_per_user
+        user_id += 1
+
+    loader.flush()
+    reset_sequences()
+    return user_ids
+
+
+def import_csv(directory, loader, use_copy=None):
+    """
+    Load <table>.csv files from directory, one per seeded model named
+    after its database table, with a header row naming the columns. On
+    PostgreSQL the files are streamed with COPY, elsewhere they are read
+    in loader sized batches. Tag keys and recipe counts the files leave
+    out are set by fill_tags(). Returns {model: rows} for the loaded files.
+    """
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    counts = {}
+    for model in seed_models():
+        path = directory / ('%s.csv' % model._meta.db_table)
+        if not path.exists():
+            continue
+        with open(path, newline='') as file:
+            reader = csv.reader(file)
+            columns = next(reader)
+            if use_copy:
+                file.seek(0)
+                with transaction.atomic():
+                    counts[model] = copy_csv(model, file, columns)
+                continue
+            fields = {
+                field.column: field for field in model._meta.concrete_fields
+            }
+            fields = [fields[column] for column in columns]
+            for values in reader:
+                loader.add(model, {
+                    field.attname: (
+                        None if value == '' and field.null else value)
+                    for field, value in zip(fields, values)
+                })
+            loader.flush()
+            counts[model] = loader.counts[model]
+    reset_sequences()
+    return counts
+
+
+def fill_tags():
+    """
+    Fill in the keys and recipe counts of tags loaded without them. Run
+    it once the indexes are rebuilt, the recount reads the recipe links
+    of every tag.
+    """
+    Tag.objects.fill_keys()
+    Tag.objects.recount()
@@ -0,0 +1,164 @@
+"""
+Signal handlers keeping recipe and collection versions current
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db.models import Count, F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from core.models import CollectionVersion, Recipe, Tag
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batched_changes(user):
+    """
+    Bump the user's collection version once after a group of writes.
+
+    Per row collection bumps from the signal handlers are suspended while
+    the block runs, so bulk paths cost one version update in total and
+    readers never see the new version before the last write. Tag recipe
+    count changes are likewise summed and written in one statement.
+    """
+    depth = getattr(_batch, 'depth', 0)
+    _batch.depth = depth + 1
+    if not depth:
+        _batch.tag_counts = Counter()
+    try:
+        yield
+    finally:
+        _batch.depth = depth
+    if not depth:
+        Tag.objects.adjust_counts(_batch.tag_counts)
+        CollectionVersion.objects.bump(user)
+
+
+def bump_collection(user_id):
+    if not getattr(_batch, 'depth', 0):
+        CollectionVersion.objects.bump(user_id)
+
+
+def count_tags(deltas):
+    """Apply tag recipe count deltas now, or with the enclosing batch"""
+    if getattr(_batch, 'depth', 0):
+        _batch.tag_counts.update(deltas)
+    else:
+        Tag.objects.adjust_counts(deltas)
+
+
+def uncount_links(links):
+    """Count down the tags of the recipe tag links in the links queryset"""
+    rows = links.values('tag_id').annotate(links=Count('pk')).order_by()
+    count_tags({row['tag_id']: -row['links'] for row in rows})
+
+
+@contextmanager
+def _suspended(handler):
+    previous = getattr(_batch, handler, False)
+    setattr(_batch, handler, True)
+    try:
+        yield
+    finally:
+        setattr(_batch, handler, previous)
+
+
+def links_uncounted():
+    """
+    Suspend per recipe link counting on delete for callers that count
+    down the links of many recipes at once with uncount_links().
+    """
+    return _suspended('links_uncounted')
+
+
+def recipes_bumped():
+    """
+    Suspend the per tag recipe version bump on delete for callers that
+    bumped the recipes of the deleted tags already, or know there are
+    none.
+    """
+    return _suspended('recipes_bumped')
+
+
+def bump_recipes(**filters):
+    Recipe.objects.filter(**filters).update(version=F('version') + 1)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_changing(sender, instance, raw=False, update_fields=None,
+                    **kwargs):
+    """Increment the version of an existing recipe as it is saved"""
+    if raw or instance._state.adding:
+        return
+    if update_fields is None or 'version' in update_fields:
+        instance.version = F('version') + 1
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+def collection_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_collection(instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, raw=False, **kwargs):
+    """A renamed tag changes every recipe showing it"""
+    if raw:
+        return
+    if not created:
+        bump_recipes(tags=instance)
+    bump_collection(instance.user_id)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    if not getattr(_batch, 'recipes_bumped', False):
+        bump_recipes(tags=instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """Links cascade without signals, so count them down beforehand"""
+    if not getattr(_batch, 'links_uncounted', False):
+        uncount_links(Recipe.tags.through.objects.filter(recipe=instance))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # Count down the links about to go, ignoring pks that are not linked
+        links = sender.objects.filter(
+            **{'tag' if reverse else 'recipe': instance})
+        if pk_set is not None:
+            links = links.filter(
+                **{'recipe__in' if reverse else 'tag__in': pk_set})
+        uncount_links(links)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_add':
+        # pk_set only holds the links that did not exist yet
+        if reverse:
+            count_tags({instance.pk: len(pk_set)})
+        else:
+            count_tags(dict.fromkeys(pk_set, 1))
+    if not reverse:
+        bump_recipes(pk=instance.pk)
+    elif pk_set:
+        bump_recipes(pk__in=pk_set)
+    else:
+        bump_recipes(tags=instance)
+    bump_collection(instance.user_id)
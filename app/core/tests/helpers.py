@@ -0,0 +1,28 @@
+"""
+Shared helpers for the test suites
+"""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Assert that a request to an endpoint stays within a query budget
+    """
+
+    def assertQueryBudget(self, budget, method, url, *args, **kwargs):
+        """Issue the request and fail if it runs more than budget queries"""
+        with CaptureQueriesContext(connection) as context:
+            res = getattr(self.client, method)(url, *args, **kwargs)
+
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                '%d. %s' % (i, query['sql'])
+                for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(
+                '%s %s ran %d queries, budget is %d:\n%s' % (
+                    method.upper(), url, executed, budget, queries)
+            )
+        return res
@@ -1,11 +1,15 @@
 """
 Tests for the Admin modification
 """
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
 
+from core.hashers import HashingBusy
+
 
 class AdminSiteTests(TestCase):
     """
@@ -43,3 +47,14 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEquals(res.status_code, 200)
+
+    @patch('core.hashers.offload', side_effect=HashingBusy)
+    def test_login_hashing_busy(self, patched_offload):
+        """Test a full hashing queue answers 503 on the admin login"""
+        res = Client().post(reverse('admin:login'), {
+            'username': 'admin@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '1')
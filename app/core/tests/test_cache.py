@@ -0,0 +1,47 @@
+"""
+Tests for the in-process cache
+"""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.cache import LRUCache
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.evictions, 1)
+
+    @patch('core.cache.time.monotonic')
+    def test_expired_entries_missing(self, patched_monotonic):
+        patched_monotonic.return_value = 100
+        cache = LRUCache(max_size=2, ttl=10)
+        cache.set('a', 1)
+
+        patched_monotonic.return_value = 111
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_evicts_over_max_bytes(self):
+        cache = LRUCache(max_size=10, ttl=60, max_bytes=10)
+        cache.set('a', b'aaaa', size=4)
+        cache.set('b', b'bbbb', size=4)
+        cache.set('c', b'cccc', size=4)
+        cache.set('huge', b'x' * 11, size=11)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.get('c'), b'cccc')
+        self.assertEqual(cache.stats()['bytes'], 8)
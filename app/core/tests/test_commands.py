@@ -1,12 +1,24 @@
 """
 Test custom django management commands
 """
+import json
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+
 from psycopg2 import OperationalError as Psycopg2Error
 
-from unittest.mock import patch
+from unittest.mock import call, patch
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core import benchmarks, seeding
+from core.models import Recipe, Tag
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -33,3 +45,229 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+    @patch('random.uniform', side_effect=lambda low, high: high)
+    @patch('time.sleep')
+    def test_wait_for_db_backs_off(self, patched_sleep, patched_uniform,
+                                   patched_check):
+        """Test retry delays double up to the maximum"""
+        patched_check.side_effect = [OperationalError] * 5 + [True]
+
+        call_command(
+            'wait_for_db', '--initial-delay', '1', '--max-delay', '4',
+            '--timeout', '0', stdout=StringIO())
+
+        self.assertEqual(
+            [call.args[0] for call in patched_sleep.call_args_list],
+            [1, 2, 4, 4, 4])
+
+    @patch('time.sleep')
+    def test_wait_for_db_deadline(self, patched_sleep, patched_check):
+        """Test giving up once the timeout has passed"""
+        patched_check.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command(
+                'wait_for_db', '--timeout', '0.01', stdout=StringIO())
+
+    @patch('core.health.check_migrations')
+    @patch('time.sleep')
+    def test_wait_for_db_migrations(self, patched_sleep, patched_migrations,
+                                    patched_check):
+        """Test waiting for migrations to be applied"""
+        patched_check.return_value = True
+        patched_migrations.side_effect = ['Unapplied migrations'] * 2 + [None]
+
+        call_command('wait_for_db', '--migrations', stdout=StringIO())
+
+        self.assertEqual(patched_migrations.call_count, 3)
+
+
+class BenchmarkCommandTests(TestCase):
+    """Test the benchmark command"""
+
+    def test_benchmark_queries_seeds_and_reports(self):
+        out = StringIO()
+
+        call_command(
+            'benchmark', 'queries',
+            '--seed-users', '2', '--recipes-per-user', '5', '--repeat', '1',
+            stdout=out,
+        )
+
+        self.assertEqual(Recipe.objects.count(), 10)
+        for name in ('recipe_list', 'recipe_keyset_page', 'tag_lookup'):
+            self.assertIn(name, out.getvalue())
+
+    def test_benchmark_renderers(self):
+        out = StringIO()
+
+        call_command(
+            'benchmark', 'renderers',
+            '--seed-users', '1', '--recipes-per-user', '20', '--repeat', '1',
+            stdout=out,
+        )
+
+        self.assertIn('FastJSONParser', out.getvalue())
+        self.assertIn('Output is byte identical', out.getvalue())
+
+    def test_benchmark_api_matches_baseline(self):
+        """Test no route does more queries than the recorded baseline"""
+        out = StringIO()
+
+        call_command(
+            'benchmark', 'api',
+            '--seed-users', '1', '--recipes-per-user', '20', '--repeat', '3',
+            stdout=out,
+        )
+
+        self.assertIn('No regressions', out.getvalue())
+        for name in ('recipe_list', 'recipe_bulk_create', 'user_token'):
+            self.assertIn(name, out.getvalue())
+
+    def test_benchmark_api_without_vendor_baseline(self):
+        """Test query counts are compared with another vendor's baseline"""
+        baseline = {'other': {'recipe_list': {'queries': 0, 'p50_ms': 0}}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'baseline.json'
+            path.write_text(json.dumps(baseline))
+
+            with self.assertRaises(CommandError) as raised:
+                call_command(
+                    'benchmark', 'api', '--baseline', str(path),
+                    '--seed-users', '1', '--recipes-per-user', '2',
+                    '--repeat', '1', '--tolerance', '2', stdout=StringIO(),
+                )
+
+        self.assertRegex(
+            str(raised.exception),
+            r'recipe_list: \d+ queries per request, baseline 0')
+        self.assertNotIn('p50', str(raised.exception))
+
+    def test_query_baseline(self):
+        baselines = {
+            'sqlite': {'recipe_list': {'queries': 3, 'p50_ms': 1.0}},
+            'postgresql': {
+                'recipe_list': {'queries': 2, 'p50_ms': 2.0},
+                'tag_list': {'queries': 1, 'p50_ms': 1.0},
+            },
+        }
+
+        self.assertEqual(benchmarks.query_baseline(baselines), {
+            'recipe_list': {'queries': 3},
+            'tag_list': {'queries': 1},
+        })
+        self.assertIsNone(benchmarks.query_baseline({}))
+
+    def test_benchmark_api_regression_fails(self):
+        results = {'recipe_list': {'queries': 4, 'p50_ms': 3.0}}
+        baseline = {'recipe_list': {'queries': 3, 'p50_ms': 1.0}}
+
+        self.assertEqual(
+            benchmarks.compare_to_baseline(results, baseline, tolerance=2),
+            [
+                'recipe_list: 4 queries per request, baseline 3',
+                'recipe_list: p50 3.00 ms, baseline 1.00 ms',
+            ])
+        self.assertEqual(benchmarks.compare_to_baseline(
+            results, {'recipe_list': {'queries': 4, 'p50_ms': 1.0}}), [])
+
+
+class SeedDataCommandTests(TestCase):
+    """Test the seed_data command"""
+
+    def test_seed_data_generates_rows(self):
+        out = StringIO()
+
+        call_command(
+            'seed_data', '--users', '3', '--recipes-per-user', '4',
+            '--tags-per-user', '5', '--tags-per-recipe', '2',
+            '--batch-size', '7', stdout=out,
+        )
+
+        self.assertEqual(get_user_model().objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 15)
+        self.assertEqual(Recipe.objects.count(), 12)
+        self.assertEqual(Recipe.tags.through.objects.count(), 24)
+        for recipe in Recipe.objects.prefetch_related('tags'):
+            self.assertEqual(
+                {tag.user_id for tag in recipe.tags.all()}, {recipe.user_id})
+        self.assertIn('Loaded 54 rows', out.getvalue())
+
+    def test_seed_data_continues_after_existing_rows(self):
+        """Test ids are allocated past rows already in the database"""
+        call_command('seed_data', '--users', '1', stdout=StringIO())
+        call_command('seed_data', '--users', '1', stdout=StringIO())
+
+        self.assertEqual(Recipe.objects.count(), 200)
+        user = get_user_model().objects.create_user(
+            'after@example.com', 'testpass123')
+        self.assertTrue(user.check_password('testpass123'))
+
+    def test_seed_data_imports_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'core_user.csv').write_text(
+                'id,email,name,password,is_active,is_staff,is_superuser,'
+                'last_login\n'
+                '41,csv@example.com,CSV,!,True,False,False,\n')
+            (directory / 'core_tag.csv').write_text(
+                'id,user_id,name\n7,41,Vegan\n')
+            (directory / 'core_recipe.csv').write_text(
+                'id,user_id,title,description,time_minutes,price,link\n'
+                '9,41,Soup,,10,4.50,\n')
+            (directory / 'core_recipe_tags.csv').write_text(
+                'id,recipe_id,tag_id\n1,9,7\n')
+
+            call_command(
+                'seed_data', '--import', str(directory), stdout=StringIO())
+
+        recipe = Recipe.objects.get(pk=9)
+        self.assertEqual(recipe.user.email, 'csv@example.com')
+        self.assertEqual(recipe.price, Decimal('4.50'))
+        self.assertEqual([tag.name for tag in recipe.tags.all()], ['Vegan'])
+        tag = Tag.objects.get(pk=7)
+        self.assertEqual((tag.key, tag.recipe_count), ('vegan', 1))
+        self.assertEqual(recipe.version, 1)
+
+    @patch('core.seeding.copy_from', return_value=1)
+    @patch('core.seeding.connection')
+    def test_copy_csv_defaults_missing_columns(self, connection, copy_from):
+        connection.ops.quote_name.side_effect = lambda name: '"%s"' % name
+        execute = connection.cursor.return_value.__enter__.return_value.execute
+
+        seeding.copy_csv(Tag, StringIO(), ['id', 'user_id', 'name'])
+
+        self.assertEqual(execute.call_args_list[:2], [
+            call('ALTER TABLE "core_tag" ALTER COLUMN "key" SET DEFAULT %s',
+                 ['']),
+            call('ALTER TABLE "core_tag" ALTER COLUMN "recipe_count" '
+                 'SET DEFAULT %s', [0]),
+        ])
+        self.assertEqual(
+            execute.call_args_list[2:],
+            [call('ALTER TABLE "core_tag" ALTER COLUMN "key" DROP DEFAULT'),
+             call('ALTER TABLE "core_tag" ALTER COLUMN "recipe_count" '
+                  'DROP DEFAULT')])
+
+    def test_seed_data_fills_tags_after_rebuilding_indexes(self):
+        """Test tags are recounted once the deferred indexes are back"""
+        events = []
+
+        @contextmanager
+        def deferred_indexes(models):
+            yield []
+            events.append('indexes')
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('core.seeding.deferred_indexes', deferred_indexes), \
+                patch('core.seeding.fill_tags',
+                      side_effect=lambda: events.append('tags')):
+            call_command(
+                'seed_data', '--import', directory, stdout=StringIO())
+
+        self.assertEqual(events, ['indexes', 'tags'])
+
+    def test_seed_data_requires_source(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_data', stdout=StringIO())
@@ -0,0 +1,27 @@
+"""
+Tests for the settings defaults
+"""
+from django.test import SimpleTestCase, override_settings
+
+from core import conf
+
+
+class ConfTests(SimpleTestCase):
+
+    @override_settings(JOB_QUEUE={'LEASE': 60})
+    def test_settings_merged_with_defaults(self):
+        options = conf.get('JOB_QUEUE')
+
+        self.assertEqual(options['LEASE'], 60)
+        self.assertEqual(
+            options['RETRY_DELAY'],
+            conf.DEFAULTS['JOB_QUEUE']['RETRY_DELAY'])
+        self.assertIs(conf.get('JOB_QUEUE'), options)
+
+    def test_reloaded_when_settings_change(self):
+        conf.get('METRICS')
+
+        with override_settings(METRICS={'TOKEN': 'secret'}):
+            self.assertEqual(conf.get('METRICS')['TOKEN'], 'secret')
+
+        self.assertNotEqual(conf.get('METRICS')['TOKEN'], 'secret')
@@ -0,0 +1,145 @@
+"""
+Tests for the database connection pool
+"""
+import os
+import threading
+from unittest.mock import MagicMock, call, patch
+
+from django.test import SimpleTestCase
+
+from core.db.backends.postgresql_pool.base import _reset
+from core.db.pool import ConnectionPool, PoolTimeout, _pools, get_pool
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+    def make_pool(self, **kwargs):
+        return ConnectionPool(
+            self.connect, check=lambda conn: conn.healthy, **kwargs)
+
+    def test_reuses_returned_connections(self):
+        pool = self.make_pool(max_size=2)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_fill_opens_min_size(self):
+        pool = self.make_pool(min_size=2, max_size=5)
+        pool.fill()
+        pool.fill()
+
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_checkout_times_out_at_max_size(self):
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        conn = pool.getconn()
+        timer = threading.Timer(0.05, pool.putconn, [conn])
+        timer.start()
+
+        self.assertIs(pool.getconn(), conn)
+        timer.join()
+
+    def test_unhealthy_connection_replaced_on_checkout(self):
+        pool = self.make_pool(check_interval=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.healthy = False
+
+        replacement = pool.getconn()
+
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        stats = pool.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['health_check_failures'], 1)
+
+    def test_failed_reset_discards_connection(self):
+        def reset(conn):
+            raise RuntimeError('broken')
+
+        pool = ConnectionPool(self.connect, reset=reset)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    @patch('core.db.pool.time.monotonic')
+    def test_idle_connections_recycled_to_min_size(self, patched_monotonic):
+        patched_monotonic.return_value = 0
+        pool = self.make_pool(min_size=1, max_size=3, max_idle=10)
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+
+        patched_monotonic.return_value = 100
+        pool.getconn()
+
+        self.assertEqual([conn.closed for conn in conns], [True, True, False])
+        self.assertEqual(pool.stats()['size'], 1)
+
+    @patch('core.db.pool.time.monotonic')
+    def test_old_connections_not_returned(self, patched_monotonic):
+        patched_monotonic.return_value = 0
+        pool = self.make_pool(max_lifetime=60)
+        conn = pool.getconn()
+
+        patched_monotonic.return_value = 100
+        pool.putconn(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['connections_closed'], 1)
+
+    def test_get_pool_replaced_after_fork(self):
+        self.addCleanup(_pools.pop, 'test-fork', None)
+        first = get_pool('test-fork', 'key', self.make_pool)
+        self.assertIs(get_pool('test-fork', 'key', self.make_pool), first)
+
+        with patch('core.db.pool.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(
+                get_pool('test-fork', 'key', self.make_pool), first)
+
+
+class PooledBackendTests(SimpleTestCase):
+
+    def test_reset_discards_session_state(self):
+        """Test returned connections are rolled back and their session reset"""
+        conn = MagicMock(closed=False, autocommit=False)
+        conn.get_transaction_status.return_value = 2  # in transaction
+        cursor = conn.cursor.return_value.__enter__.return_value
+
+        _reset(conn)
+
+        conn.rollback.assert_called_once_with()
+        self.assertEqual(cursor.execute.call_args_list, [call('DISCARD ALL')])
+        self.assertFalse(conn.autocommit)
@@ -0,0 +1,57 @@
+"""
+Tests for the pooled password hashers
+"""
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.test import SimpleTestCase, override_settings
+
+from core import hashers
+
+
+PBKDF2 = ['core.hashers.PBKDF2PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHERS=PBKDF2)
+class PooledHasherTests(SimpleTestCase):
+
+    @override_settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000})
+    def test_cost_from_settings(self):
+        encoded = make_password('testpass123')
+
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(check_password('testpass123', encoded))
+
+    def test_hashes_on_worker_thread(self):
+        threads = []
+        encode = hashers.hashers.PBKDF2PasswordHasher.encode
+
+        def record(hasher, *args):
+            threads.append(threading.current_thread().name)
+            return encode(hasher, *args)
+
+        with patch.object(
+                hashers.hashers.PBKDF2PasswordHasher, 'encode', record):
+            encoded = make_password('testpass123')
+            check_password('testpass123', encoded)
+
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(
+            name.startswith('password-hash') for name in threads))
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 0})
+    def test_no_workers_hashes_inline(self):
+        with patch.object(hashers, '_get_pool') as patched_pool:
+            make_password('testpass123')
+
+        patched_pool.assert_not_called()
+
+    def test_full_queue_sheds_load(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+
+        with patch.object(hashers, '_get_pool', return_value=(None, slots)):
+            with override_settings(PASSWORD_HASHING={'WAIT': 0}):
+                with self.assertRaises(hashers.HashingBusy):
+                    make_password('testpass123')
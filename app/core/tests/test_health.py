@@ -0,0 +1,70 @@
+"""
+Tests for the health probe endpoints
+"""
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+
+from core import health
+
+
+HEALTHZ_URL = reverse('healthz')
+READYZ_URL = reverse('readyz')
+
+
+class HealthProbeTests(TestCase):
+
+    def setUp(self):
+        health._migrated.clear()
+
+    def test_healthz_skips_database(self):
+        with self.assertNumQueries(0):
+            res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_readyz_ready(self):
+        res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['checks'], {
+            'database': 'ok',
+            'migrations': 'ok',
+        })
+
+    def test_readyz_remembers_migrations_applied(self):
+        self.client.get(READYZ_URL)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    @patch('core.health.check_database', return_value='connection refused')
+    def test_readyz_database_down(self, patched_check):
+        with self.assertLogs('core.views', 'WARNING') as logs:
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json(), {
+            'status': 'unavailable',
+            'checks': {'database': 'failed'},
+        })
+        self.assertIn('connection refused', logs.output[0])
+
+    @patch('core.health.MigrationExecutor')
+    def test_readyz_unapplied_migrations(self, patched_executor):
+        migration = type('Migration', (), {
+            'app_label': 'core', 'name': '9999_pending'})
+        patched_executor.return_value.migration_plan.return_value = [
+            (migration, False)]
+
+        with self.assertLogs('core.views', 'WARNING') as logs:
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['migrations'], 'failed')
+        self.assertIn(
+            'Unapplied migrations: core.9999_pending', logs.output[0])
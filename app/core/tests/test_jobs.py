@@ -0,0 +1,167 @@
+"""
+Tests for the background job queue
+"""
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+
+calls = []
+
+
+@jobs.task('test.add')
+def add(context, a, b):
+    context.progress(1, 1)
+    return a + b
+
+
+@jobs.task('test.flaky')
+def flaky(context, failures):
+    calls.append(context.job.attempts)
+    if len(calls) <= failures:
+        raise RuntimeError('Attempt %d failed' % context.job.attempts)
+    return len(calls)
+
+
+@jobs.task('test.cancelled')
+def cancelled(context):
+    Job.objects.filter(pk=context.job.pk).update(status=Job.CANCELLED)
+    context.progress(1)
+    calls.append('after cancel')
+
+
+@override_settings(JOB_QUEUE={'RETRY_DELAY': 0, 'MAX_ATTEMPTS': 3})
+class JobQueueTests(TestCase):
+    """Test enqueueing, leasing and running jobs"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_runs_due_jobs(self):
+        job = jobs.enqueue('test.add', a=2, b=3)
+        later = jobs.enqueue('test.add', delay=60, a=1, b=1)
+
+        self.assertEqual(jobs.Worker('test').run(burst=True), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, 5)
+        self.assertEqual((job.progress, job.total), (1, 1))
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished)
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+
+    def test_failed_attempts_are_retried(self):
+        job = jobs.enqueue('test.flaky', failures=2)
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.Worker('test').run(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(calls, [1, 2, 3])
+        self.assertEqual(job.result, 3)
+
+    def test_job_fails_after_max_attempts(self):
+        job = jobs.enqueue('test.flaky', failures=5)
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.Worker('test').run(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('RuntimeError: Attempt 3 failed', job.error)
+
+    @override_settings(JOB_QUEUE={'RETRY_DELAY': 60})
+    def test_retry_backs_off(self):
+        job = jobs.enqueue('test.flaky', failures=1)
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.Worker('test').run(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=50))
+
+    def test_expired_lease_is_claimed_again(self):
+        """Test a job whose worker died is taken over by another."""
+        job = jobs.enqueue('test.add', a=1, b=2)
+        first = jobs.claim('dead-worker')
+        self.assertEqual(first.pk, job.pk)
+        self.assertIsNone(jobs.claim('other-worker'))
+
+        Job.objects.filter(pk=job.pk).update(
+            leased_until=timezone.now() - timedelta(seconds=1))
+        second = jobs.claim('other-worker')
+
+        self.assertEqual(second.pk, job.pk)
+        self.assertEqual(second.attempts, 2)
+        with self.assertRaises(jobs.JobStopped):
+            jobs.JobContext(first, 60).progress(1)
+
+    def test_reap_fails_expired_last_attempt(self):
+        job = jobs.enqueue('test.add', a=1, b=2)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, attempts=3,
+            leased_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(jobs.reap(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_cancelled_job_stops_at_next_report(self):
+        job = jobs.enqueue('test.cancelled')
+
+        jobs.Worker('test').run(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertEqual(calls, [])
+
+    def test_worker_survives_finish_database_error(self):
+        job = jobs.enqueue('test.flaky', failures=0)
+        claimed = jobs.claim('test', 60)
+
+        with patch.object(
+                Job.objects, 'filter', side_effect=DatabaseError('gone')), \
+                self.assertLogs('core.jobs', 'ERROR') as logs:
+            outcome = jobs.run(claimed)
+
+        self.assertEqual(outcome, 'succeeded')
+        self.assertIn('Job %d outcome could not be stored' % job.pk,
+                      logs.output[0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+    def test_run_worker_command(self):
+        job = jobs.enqueue('test.add', a=4, b=4)
+        out = StringIO()
+
+        call_command('run_worker', '--burst', stdout=out)
+
+        job.refresh_from_db()
+        self.assertEqual(job.result, 8)
+        self.assertIn('Ran 1 jobs', out.getvalue())
+
+    def test_job_gauges_are_cached(self):
+        jobs._job_gauges['expires'] = 0
+        jobs.enqueue('test.add', a=1, b=1)
+
+        with self.assertNumQueries(1):
+            gauges = jobs._collect_jobs()
+        jobs.enqueue('test.add', a=2, b=2)
+        with self.assertNumQueries(0):
+            self.assertEqual(jobs._collect_jobs(), gauges)
+
+        self.assertEqual(gauges['jobs', (('status', Job.QUEUED),)], 1)
@@ -0,0 +1,120 @@
+"""
+Tests for the performance middleware and metrics endpoint
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Recipe
+from recipe.mixins import response_cache
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('metrics')
+
+
+def server_timing(response):
+    """Return {metric: (duration, description)} from Server-Timing"""
+    timings = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        timings[name] = (float(params['dur']), params.get('desc'))
+    return timings
+
+
+class PerformanceMiddlewareTests(TestCase):
+
+    def setUp(self):
+        metrics.registry.clear()
+        response_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpassword123')
+        Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price='7.50')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_header(self):
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        timings = server_timing(res)
+        self.assertEqual(timings['db'][1], '"3 queries"')
+        self.assertGreater(timings['db'][0], 0)
+        self.assertGreater(timings['serializer'][0], 0)
+        self.assertGreater(timings['render'][0], 0)
+        self.assertGreaterEqual(timings['total'][0], timings['db'][0])
+
+    @override_settings(PERFORMANCE={'SERVER_TIMING': False})
+    def test_server_timing_disabled(self):
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    def test_metrics_endpoint(self):
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+        staff = get_user_model().objects.create_user(
+            email='staff@example.com', password='testpassword123',
+            is_staff=True)
+        self.client.force_login(staff)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        body = res.content.decode()
+        labels = 'view="recipe:recipe-list",method="GET"'
+        self.assertIn(
+            'http_requests_total{%s,status="200"} 2' % labels, body)
+        self.assertIn(
+            'http_request_duration_seconds_count{%s} 2' % labels, body)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{%s,le="+Inf"} 2' % labels,
+            body)
+        self.assertRegex(
+            body, r'http_db_queries_total\{%s\} [1-9]' % re.escape(labels))
+        self.assertRegex(body, r'cache_hits\{cache="response"\} [1-9]')
+
+    def test_metrics_endpoint_forbidden(self):
+        self.client.force_login(self.user)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 403)
+
+    @override_settings(METRICS={'TOKEN': 'scrape-secret'})
+    def test_metrics_endpoint_token(self):
+        client = APIClient()
+
+        res = client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(res.status_code, 200)
+
+        res = client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(res.status_code, 403)
+
+    @override_settings(METRICS={'ENABLED': False})
+    def test_metrics_endpoint_disabled(self):
+        res = APIClient().get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 404)
+
+    @override_settings(PERFORMANCE={
+        'QUERY_BUDGETS': {'recipe:recipe-list': 1},
+    })
+    def test_query_budget_exceeded(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(RECIPES_URL)
+
+        self.assertIn('ran 3 queries, budget is 1', logs.output[0])
+        self.assertIn(
+            'http_query_budget_exceeded_total{view="recipe:recipe-list",'
+            'method="GET"} 1',
+            metrics.registry.render())
@@ -3,6 +3,7 @@ Tests for models
 """
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from decimal import Decimal
 
 from core import models
@@ -96,4 +97,50 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(tag), tag.name)
 
+    def test_tag_name_unique_per_user(self):
+        user = create_user()
+        models.Tag.objects.create(user=user, name='Tag1')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.Tag.objects.create(user=user, name='Tag1')
+
+    def test_get_or_create_many_tags(self):
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        existing = models.Tag.objects.create(user=user, name='Vegan')
+        models.Tag.objects.create(user=other_user, name='Dinner')
+
+        with self.assertNumQueries(3):
+            tags = models.Tag.objects.get_or_create_many(
+                user, ['Vegan', 'Dinner', 'Lunch', 'Dinner'])
+
+        self.assertEqual(list(tags), ['Vegan', 'Dinner', 'Lunch'])
+        self.assertEqual(tags['Vegan'], existing)
+        self.assertEqual(models.Tag.objects.filter(user=user).count(), 3)
+        for tag in tags.values():
+            self.assertEqual(tag.user, user)
+            self.assertIsNotNone(tag.id)
+
+    def test_tag_key_normalizes_name(self):
+        user = create_user()
+        tag = models.Tag.objects.create(user=user, name='  Vegan   Food ')
+
+        self.assertEqual(tag.key, 'vegan food')
+        tag.name = 'Quick'
+        tag.save(update_fields=['name'])
+        tag.refresh_from_db()
+        self.assertEqual(tag.key, 'quick')
+
+    def test_get_or_create_many_matches_tag_keys(self):
+        user = create_user()
+        existing = models.Tag.objects.create(user=user, name='Vegan')
+
+        tags = models.Tag.objects.get_or_create_many(
+            user, ['vegan ', 'VEGAN', 'Quick meals', 'quick  Meals'])
 
+        self.assertEqual(tags['vegan '], existing)
+        self.assertEqual(tags['VEGAN'], existing)
+        self.assertEqual(tags['Quick meals'], tags['quick  Meals'])
+        self.assertEqual(
+            sorted(models.Tag.objects.values_list('name', flat=True)),
+            ['Quick meals', 'Vegan'])
@@ -0,0 +1,96 @@
+"""
+Tests for the orjson backed renderer and parser
+"""
+import datetime
+import io
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+
+DATA = {
+    'id': 1,
+    'title': 'Crème brûlée\u2028',
+    'price': Decimal('5.25'),
+    'created': datetime.datetime(2024, 1, 2, 3, 4, 5, 678901,
+                                 tzinfo=timezone.utc),
+    'day': datetime.date(2024, 1, 2),
+    'detail': gettext_lazy('Not found.'),
+    'tags': [{'id': 2, 'name': 'Vegan'}],
+    3: (True, None, 1.5),
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def test_matches_stock_renderer(self):
+        self.assertEqual(
+            FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    def test_indented_output_falls_back(self):
+        media_type = 'application/json; indent=2'
+
+        self.assertEqual(
+            FastJSONRenderer().render(DATA, media_type),
+            JSONRenderer().render(DATA, media_type))
+
+    def test_unsupported_values_fall_back(self):
+        data = {'big': 2 ** 70}
+
+        self.assertEqual(FastJSONRenderer().render(data), b'{"big":%d}' % (
+            2 ** 70))
+
+    def test_non_finite_floats_fall_back(self):
+        data = {'tags': [{'score': float('nan')}], 'id': None}
+
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data)
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render(data)
+
+        class LaxRenderer(FastJSONRenderer):
+            strict = False
+
+        self.assertEqual(
+            LaxRenderer().render(data), b'{"tags":[{"score":NaN}],"id":null}')
+
+    def test_without_orjson(self):
+        with mock.patch('core.renderers.orjson', None):
+            self.assertEqual(
+                FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    def test_none_renders_empty(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class FastJSONParserTests(SimpleTestCase):
+
+    def _parse(self, content, parser=None):
+        return (parser or FastJSONParser()).parse(io.BytesIO(content))
+
+    def test_matches_stock_parser(self):
+        content = JSONRenderer().render(DATA)
+
+        self.assertEqual(
+            self._parse(content), self._parse(content, JSONParser()))
+
+    def test_unsupported_documents_fall_back(self):
+        self.assertEqual(self._parse(b'[%d]' % 2 ** 70), [2 ** 70])
+
+    def test_invalid_json(self):
+        for content in (b'{"title": ', b'[NaN]'):
+            with self.assertRaises(ParseError):
+                self._parse(content)
+
+    def test_without_orjson(self):
+        with mock.patch('core.parsers.orjson', None):
+            self.assertEqual(self._parse(b'{"id": 1}'), {'id': 1})
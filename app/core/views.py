@@ -0,0 +1,77 @@
+"""
+Health probe and metrics views
+"""
+import logging
+
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+)
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+from core import conf, health, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+@never_cache
+def healthz(request):
+    """Report the process is up without touching the database"""
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+def readyz(request):
+    """
+    Report whether the database is reachable and fully migrated.
+
+    Failures are logged and answered as 'failed' only, so database errors
+    are not shown to whoever can reach the probe.
+    """
+    ready, checks = health.readiness()
+    for name, error in checks.items():
+        if error:
+            logger.warning('Readiness check %s failed: %s', name, error)
+    return JsonResponse(
+        {
+            'status': 'ok' if ready else 'unavailable',
+            'checks': {
+                name: 'failed' if error else 'ok'
+                for name, error in checks.items()
+            },
+        },
+        status=200 if ready else 503,
+    )
+
+
+def _metrics_allowed(request):
+    """Return whether request carries the metrics token or a staff user"""
+    token = conf.get('METRICS')['TOKEN']
+    if token:
+        scheme, _, credentials = request.META.get(
+            'HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() == 'bearer' and constant_time_compare(
+                credentials, token):
+            return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_active and user.is_staff)
+
+
+@never_cache
+def metrics_view(request):
+    """
+    Expose this process's metrics in the Prometheus text format to staff
+    users and scrapers sending the METRICS['TOKEN'] bearer token.
+    """
+    if not conf.get('METRICS')['ENABLED']:
+        raise Http404()
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,59 @@
+"""
+Serializers for the job API
+"""
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
+from rest_framework import serializers
+
+from core import jobs
+from core.models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for enqueueing and polling jobs"""
+    args = serializers.JSONField(required=False, default=dict)
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'name', 'args', 'status', 'attempts', 'progress', 'total',
+            'result', 'error', 'created', 'started', 'finished',
+        ]
+        read_only_fields = [
+            'id', 'status', 'attempts', 'progress', 'total', 'result',
+            'error', 'created', 'started', 'finished',
+        ]
+
+    @extend_schema_field(OpenApiTypes.STR)
+    def get_error(self, job):
+        """Return the exception line of the last failure, not the trace"""
+        lines = job.error.strip().splitlines()
+        return lines[-1] if lines else ''
+
+    def validate_name(self, value):
+        task = jobs.tasks.get(value)
+        if task is None or not task.public:
+            raise serializers.ValidationError('Unknown job.')
+        return value
+
+    def validate(self, attrs):
+        task = jobs.tasks[attrs['name']]
+        args = attrs.get('args') or {}
+        if task.args_serializer is None:
+            if args:
+                raise serializers.ValidationError(
+                    {'args': ['This job takes no arguments.']})
+            return attrs
+        serializer = task.args_serializer(data=args)
+        if not serializer.is_valid():
+            raise serializers.ValidationError({'args': serializer.errors})
+        attrs['args'] = serializer.validated_data
+        return attrs
+
+    def create(self, validated_data):
+        return jobs.enqueue(
+            validated_data['name'],
+            user=validated_data['user'],
+            **validated_data['args'],
+        )
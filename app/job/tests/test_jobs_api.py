@@ -0,0 +1,136 @@
+"""
+Tests for the job API
+"""
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import Job, Recipe, Tag
+
+
+JOBS_URL = reverse('job:job-list')
+
+
+def detail_url(job_id):
+    return reverse('job:job-detail', args=[job_id])
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'testpass123')
+
+
+class PublicJobApiTests(TestCase):
+    def test_auth_required(self):
+        res = APIClient().get(JOBS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateJobApiTests(TestCase):
+    """Test enqueueing and polling jobs"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_export_job(self):
+        """Test an export job writes the collection to a downloadable file."""
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price=Decimal('1.00'))
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{i}'))
+
+        res = self.client.post(
+            JOBS_URL, {'name': 'recipe.export', 'args': {'output': 'ndjson'}},
+            format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['status'], Job.QUEUED)
+        jobs.Worker('test').run(burst=True)
+
+        res = self.client.get(detail_url(res.data['id']))
+        self.assertEqual(res.data['status'], Job.SUCCEEDED)
+        self.assertEqual((res.data['progress'], res.data['total']), (3, 3))
+        self.assertEqual(res.data['result']['rows'], 3)
+
+        download = self.client.get(
+            reverse('job:job-download', args=[res.data['id']]))
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)['title'] for line in lines],
+            ['Recipe 2', 'Recipe 1', 'Recipe 0'])
+
+    def test_clean_job_files(self):
+        """Test export files are deleted once older than the max age."""
+        job = jobs.enqueue('recipe.export', user=self.user)
+        jobs.Worker('test').run(burst=True)
+        job.refresh_from_db()
+        name = job.result['file']
+        download_url = reverse('job:job-download', args=[job.id])
+
+        call_command('clean_job_files', stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
+
+        out = StringIO()
+        call_command('clean_job_files', '--max-age', '0', stdout=out)
+
+        self.assertIn('Deleted 1 job files', out.getvalue())
+        self.assertFalse(default_storage.exists(name))
+        job.refresh_from_db()
+        self.assertEqual(job.result, {'rows': 0})
+        res = self.client.get(download_url)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_private_job_rejected(self):
+        res = self.client.post(
+            JOBS_URL, {'name': 'user.delete_account',
+                       'args': {'user_id': 1}}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+
+    def test_invalid_args_rejected(self):
+        res = self.client.post(
+            JOBS_URL, {'name': 'recipe.export', 'args': {'output': 'xml'}},
+            format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('args', res.data)
+
+    def test_jobs_limited_to_user(self):
+        jobs.enqueue('recipe.export', user=create_user('other@example.com'))
+        job = jobs.enqueue('recipe.export', user=self.user)
+
+        res = self.client.get(JOBS_URL)
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [job.id])
+
+    def test_cancel_queued_job(self):
+        job = jobs.enqueue('recipe.export', user=self.user)
+
+        res = self.client.post(reverse('job:job-cancel', args=[job.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], Job.CANCELLED)
+        self.assertEqual(jobs.Worker('test').run(burst=True), 0)
+        res = self.client.post(reverse('job:job-cancel', args=[job.id]))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,14 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from job import views
+
+
+router = DefaultRouter()
+router.register('jobs', views.JobViewSet)
+
+app_name = 'job'
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -0,0 +1,70 @@
+"""
+Views for the job API
+"""
+import os
+
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.utils import timezone
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from core.models import Job
+from job import serializers
+from recipe.pagination import IdCursorPagination
+from user.authentication import CachedTokenAuthentication
+
+
+class JobViewSet(
+        mixins.CreateModelMixin,
+        mixins.ListModelMixin,
+        mixins.RetrieveModelMixin,
+        viewsets.GenericViewSet):
+    """Enqueue background jobs and poll their progress"""
+    serializer_class = serializers.JobSerializer
+    queryset = Job.objects.all()
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        """Retrieve jobs of the authenticated user."""
+        return self.queryset.filter(user=self.request.user).order_by('-id')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel a queued job, or stop a running one at its next report."""
+        job = self.get_object()
+        cancelled = Job.objects.filter(
+            pk=job.pk, status__in=[Job.QUEUED, Job.RUNNING],
+        ).update(
+            status=Job.CANCELLED, finished=timezone.now(), leased_until=None)
+        if not cancelled:
+            return Response(
+                {'status': ['The job has already finished.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the file written by a finished job."""
+        job = self.get_object()
+        name = (job.result or {}).get('file')
+        if job.status != Job.SUCCEEDED or not name:
+            raise Http404('The job has no file.')
+        return FileResponse(
+            default_storage.open(name, 'rb'),
+            as_attachment=True,
+            filename=os.path.basename(name),
+        )
@@ -0,0 +1,264 @@
+"""
+Batched write helpers for recipes and their tags
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, Min, OuterRef
+
+from core.models import Recipe, Tag
+from core.signals import (
+    batched_changes,
+    bump_recipes,
+    count_tags,
+    links_uncounted,
+    recipes_bumped,
+    uncount_links,
+)
+
+
+BATCH_SIZE = 500
+
+
+def attach_tags(user, recipe_tags):
+    """
+    Attach tags by name to recipes owned by user.
+
+    recipe_tags is an iterable of (recipe, tag_names) pairs. All names are
+    resolved with one lookup and the through rows are written with one
+    bulk insert whatever the number of recipes.
+    """
+    recipe_tags = [
+        (recipe, list(names)) for recipe, names in recipe_tags if names
+    ]
+    tags = Tag.objects.get_or_create_many(
+        user,
+        [name for _, names in recipe_tags for name in names],
+    )
+    RecipeTag = Recipe.tags.through
+    links = [
+        RecipeTag(recipe_id=recipe.id, tag_id=tag_id)
+        for recipe, names in recipe_tags
+        for tag_id in dict.fromkeys(tags[name].id for name in names)
+    ]
+    RecipeTag.objects.bulk_create(
+        links, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    # Callers attach tags to recipes without links to them, so every link
+    # is counted as new
+    count_tags(Counter(link.tag_id for link in links))
+
+
+def set_tags(user, recipe_tags):
+    """
+    Replace the tags of recipes owned by user with tags named by name.
+
+    recipe_tags is an iterable of (recipe, tag_names) pairs. The current
+    links of all recipes are read in one query and compared with the
+    wanted ones, so only links that changed are deleted and inserted,
+    each in one statement, and an unchanged tag set writes nothing.
+    """
+    recipe_tags = [
+        (recipe, list(dict.fromkeys(names))) for recipe, names in recipe_tags
+    ]
+    if not recipe_tags:
+        return
+    tags = Tag.objects.get_or_create_many(
+        user,
+        [name for _, names in recipe_tags for name in names],
+    )
+    wanted = {
+        (recipe.id, tags[name].id): None
+        for recipe, names in recipe_tags
+        for name in names
+    }
+    RecipeTag = Recipe.tags.through
+    current = {
+        (recipe_id, tag_id): link_id
+        for link_id, recipe_id, tag_id in RecipeTag.objects.filter(
+            recipe_id__in=[recipe.id for recipe, _ in recipe_tags]
+        ).values_list('id', 'recipe_id', 'tag_id')
+    }
+
+    removed = [key for key in current if key not in wanted]
+    if removed:
+        RecipeTag.objects.filter(
+            id__in=[current[key] for key in removed]).delete()
+        count_tags({
+            tag_id: -count
+            for tag_id, count in Counter(
+                tag_id for _, tag_id in removed).items()
+        })
+    added = [
+        RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id, tag_id in wanted if (recipe_id, tag_id) not in current
+    ]
+    if added:
+        RecipeTag.objects.bulk_create(
+            added, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        count_tags(Counter(link.tag_id for link in added))
+
+
+def _tag_names(validated_data):
+    return [tag['name'] for tag in validated_data.pop('tags')]
+
+
+@transaction.atomic
+def create_recipes(user, items):
+    """
+    Create recipes from a list of validated serializer data.
+
+    Rows are inserted with bulk_create where the backend returns primary
+    keys from bulk inserts and saved one by one otherwise.
+    """
+    items = [dict(item) for item in items]
+    tag_names = [
+        _tag_names(item) if 'tags' in item else [] for item in items
+    ]
+    recipes = [Recipe(**{'user': user, **item}) for item in items]
+
+    with batched_changes(user):
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes, batch_size=BATCH_SIZE)
+        else:
+            for recipe in recipes:
+                recipe.save()
+
+        attach_tags(user, zip(recipes, tag_names))
+    return recipes
+
+
+@transaction.atomic
+def update_recipes(user, updates):
+    """
+    Apply a list of (recipe, validated_data) updates.
+
+    Changed columns are written with a single bulk_update and recipes that
+    were given tags only have their changed links rewritten.
+    """
+    fields = set()
+    retagged = []
+    for recipe, validated_data in updates:
+        validated_data = dict(validated_data)
+        if 'tags' in validated_data:
+            retagged.append((recipe, _tag_names(validated_data)))
+        for attr, value in validated_data.items():
+            setattr(recipe, attr, value)
+        fields.update(validated_data)
+
+    with batched_changes(user):
+        if fields:
+            Recipe.objects.bulk_update(
+                [recipe for recipe, _ in updates],
+                fields,
+                batch_size=BATCH_SIZE,
+            )
+        Recipe.objects.filter(
+            id__in=[recipe.id for recipe, _ in updates]
+        ).update(version=F('version') + 1)
+        set_tags(user, retagged)
+    return [recipe for recipe, _ in updates]
+
+
+@transaction.atomic
+def delete_recipes(user, queryset):
+    """Delete the recipes in queryset, returning how many were removed."""
+    with batched_changes(user), links_uncounted():
+        uncount_links(Recipe.tags.through.objects.filter(recipe__in=queryset))
+        _, deleted = queryset.delete()
+    return deleted.get(Recipe._meta.label, 0)
+
+
+@transaction.atomic
+def merge_tags(user, target, sources):
+    """
+    Fold the source tags of user into target and delete them.
+
+    Each recipe tagged with a source but not with target has one of its
+    source links pointed at target, all in a single UPDATE of the through
+    rows. The links left over would duplicate target and are deleted
+    with the source tags. Returns the number of recipes that gained
+    target.
+    """
+    source_ids = [tag.pk for tag in sources if tag.pk != target.pk]
+    if not source_ids:
+        return 0
+    RecipeTag = Recipe.tags.through
+    moving = (
+        RecipeTag.objects.filter(tag_id__in=source_ids)
+        .exclude(recipe_id__in=RecipeTag.objects.filter(
+            tag_id=target.pk).values('recipe_id'))
+        .values('recipe_id')
+        .annotate(first=Min('id'))
+        .values('first')
+    )
+    with batched_changes(user), recipes_bumped():
+        bump_recipes(tags__in=source_ids)
+        moved = RecipeTag.objects.filter(id__in=moving).update(
+            tag_id=target.pk)
+        count_tags({target.pk: moved})
+        Tag.objects.filter(pk__in=source_ids).delete()
+    return moved
+
+
+def merge_duplicate_tags(users=None):
+    """
+    Merge tags sharing a tag key into the oldest of them, for all users
+    or those in users. Each group is merged in its own transaction.
+    Returns the number of tags merged away.
+    """
+    tags = Tag.objects.all()
+    if users:
+        tags = tags.filter(user_id__in=users)
+    duplicates = (
+        tags.values('user_id', 'key')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    merged = 0
+    for duplicate in duplicates:
+        target, *sources = Tag.objects.filter(
+            user_id=duplicate['user_id'], key=duplicate['key']
+        ).order_by('id')
+        merge_tags(duplicate['user_id'], target, sources)
+        merged += len(sources)
+    return merged
+
+
+def delete_unused_tags(batch_size=BATCH_SIZE, users=None):
+    """
+    Delete the tags no recipe uses, for all users or those in users.
+
+    Tags are locked and deleted batch_size at a time in short
+    transactions, skipping rows locked by concurrent writers, and are
+    checked again for links once locked. Yields the number of tags
+    deleted by each batch.
+    """
+    RecipeTag = Recipe.tags.through
+    unused = Tag.objects.filter(
+        ~Exists(RecipeTag.objects.filter(tag_id=OuterRef('pk'))))
+    if users:
+        unused = unused.filter(user_id__in=users)
+    if connection.features.has_select_for_update_skip_locked:
+        unused = unused.select_for_update(skip_locked=True)
+    last = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                unused.filter(pk__gt=last).order_by('pk')
+                .values_list('pk', 'user_id')[:batch_size]
+            )
+            if not rows:
+                return
+            last = rows[-1][0]
+            used = set(RecipeTag.objects.filter(
+                tag_id__in=[pk for pk, _ in rows]
+            ).values_list('tag_id', flat=True))
+            by_user = {}
+            for pk, user_id in rows:
+                if pk not in used:
+                    by_user.setdefault(user_id, []).append(pk)
+            for user_id, ids in by_user.items():
+                with batched_changes(user_id), recipes_bumped():
+                    Tag.objects.filter(pk__in=ids).delete()
+        yield sum(len(ids) for ids in by_user.values())
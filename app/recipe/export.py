@@ -0,0 +1,72 @@
+"""
+Streaming exports of recipe collections
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+
+CHUNK_SIZE = 1000
+
+
+def iter_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of at most chunk_size rows from queryset.
+
+    Rows are fetched with iterator(), a server-side cursor on PostgreSQL,
+    so neither the database driver nor Django cache the whole result.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_pages(queryset, serializer, chunk_size=CHUNK_SIZE):
+    """
+    Yield the representations of queryset a chunk at a time, rendered by
+    the list serializer so related rows are looked up once per chunk.
+    """
+    for chunk in iter_chunks(queryset, chunk_size):
+        yield serializer.to_representation(chunk)
+
+
+def ndjson_stream(pages):
+    """Yield each page as compact JSON documents, one per line"""
+    for page in pages:
+        yield ''.join(
+            json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for item in page
+        )
+
+
+def csv_stream(pages, columns):
+    """
+    Yield a header row then each page as CSV rows. The tags column holds
+    a JSON array of the tag names.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for page in pages:
+        for item in page:
+            writer.writerow([
+                json.dumps(
+                    [tag['name'] for tag in item[column]], ensure_ascii=False)
+                if column == 'tags' else item[column]
+                for column in columns
+            ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
@@ -0,0 +1,81 @@
+"""
+Resumable batched imports of recipe uploads
+"""
+from itertools import islice
+
+from django.db import transaction
+
+from core.models import RecipeImport
+from recipe.parsers import RowParseError
+
+
+BATCH_SIZE = 1000
+
+
+class ImportConflict(Exception):
+    """Another request has committed rows of the same import"""
+
+
+def _fail(recipe_import, errors):
+    recipe_import.status = RecipeImport.FAILED
+    recipe_import.errors = errors
+    recipe_import.save(update_fields=['status', 'errors', 'modified'])
+
+
+def _commit(recipe_import, serializer, user):
+    """
+    Save a validated batch and advance the import past it in the same
+    transaction, so a batch is either committed and counted or neither.
+    """
+    with transaction.atomic():
+        rows = RecipeImport.objects.select_for_update().filter(
+            pk=recipe_import.pk).values_list('rows', flat=True).get()
+        if rows != recipe_import.rows:
+            raise ImportConflict()
+        serializer.save(user=user)
+        recipe_import.rows += len(serializer.initial_data)
+        recipe_import.save(update_fields=['rows', 'modified'])
+
+
+def import_rows(recipe_import, rows, serializer_class, context,
+                batch_size=BATCH_SIZE):
+    """
+    Validate and save rows batch_size at a time for recipe_import.
+
+    Rows already committed by an earlier attempt are skipped, so a failed
+    or interrupted import is resumed by sending the same upload again.
+    Each batch is validated as a whole and committed in its own
+    transaction. The first invalid batch or malformed row stops the
+    import as failed with the errors of the offending rows, leaving every
+    earlier batch committed.
+    """
+    user = recipe_import.user
+    recipe_import.status = RecipeImport.RUNNING
+    recipe_import.errors = []
+    recipe_import.save(update_fields=['status', 'errors', 'modified'])
+
+    rows = islice(rows, recipe_import.rows, None)
+    while True:
+        try:
+            batch = list(islice(rows, batch_size))
+        except RowParseError as exc:
+            _fail(recipe_import, [
+                {'row': exc.row, 'errors': {'non_field_errors': [exc.detail]}}
+            ])
+            return recipe_import
+        if not batch:
+            break
+
+        serializer = serializer_class(data=batch, many=True, context=context)
+        if not serializer.is_valid():
+            _fail(recipe_import, [
+                {'row': recipe_import.rows + index, 'errors': errors}
+                for index, errors in enumerate(serializer.errors, start=1)
+                if errors
+            ])
+            return recipe_import
+        _commit(recipe_import, serializer, user)
+
+    recipe_import.status = RecipeImport.COMPLETED
+    recipe_import.save(update_fields=['status', 'modified'])
+    return recipe_import
@@ -0,0 +1,241 @@
+"""
+Reusable viewset mixins for the recipe APIs
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    quote_etag,
+)
+from django.utils.http import http_date
+from rest_framework import serializers
+
+from core import conf
+from core.cache import LRUCache
+from core.metrics import register_cache
+from core.models import CollectionVersion
+
+
+_options = conf.get('RESPONSE_CACHE')
+response_cache = LRUCache(
+    max_size=_options['MAX_ENTRIES'],
+    max_bytes=_options['MAX_BYTES'],
+    ttl=_options['TTL'],
+)
+register_cache('response', response_cache)
+
+
+def plan_queryset(queryset, serializer):
+    """
+    Return queryset narrowed to what serializer renders.
+
+    Nested serializers over to-many relations are prefetched (recursively
+    planned themselves), nested serializers over forward relations are
+    joined with select_related and plain model fields are loaded with
+    only(). Fields that do not map onto a model field (method fields,
+    dotted sources) disable the only() narrowing. Nested rows without a
+    model ordering are ordered by primary key so output is stable.
+
+    Serializers that know better can provide their own plan_queryset().
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if hasattr(serializer, 'plan_queryset'):
+        return serializer.plan_queryset(queryset)
+    opts = queryset.model._meta
+    only = [opts.pk.name]
+    select = []
+    prefetch = []
+    can_narrow = True
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        source = field.source
+        if source == '*' or '.' in source:
+            can_narrow = False
+            continue
+        try:
+            model_field = opts.get_field(source)
+        except FieldDoesNotExist:
+            can_narrow = False
+            continue
+
+        if model_field.many_to_many or model_field.one_to_many:
+            if isinstance(field, serializers.BaseSerializer):
+                related = model_field.related_model._default_manager.all()
+                if not related.ordered:
+                    related = related.order_by('pk')
+                prefetch.append(
+                    Prefetch(source, queryset=plan_queryset(related, field))
+                )
+            else:
+                prefetch.append(source)
+        elif model_field.is_relation:
+            only.append(source)
+            if isinstance(field, serializers.BaseSerializer):
+                select.append(source)
+        else:
+            only.append(source)
+
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if can_narrow and not select:
+        queryset = queryset.only(*only)
+    return queryset
+
+
+class QueryPlanMixin:
+    """
+    Plan the viewset queryset from its active serializer so reads cost a
+    constant number of queries whatever the size of the page.
+    """
+    query_plan_actions = ('list', 'retrieve')
+
+    def plan_queryset(self, queryset):
+        """Apply the serializer driven query plan for read actions."""
+        if self.action not in self.query_plan_actions:
+            return queryset
+        return plan_queryset(queryset, self.get_serializer())
+
+
+class SparseFieldsetMixin:
+    """
+    Hand the ?fields= and ?expand= lists of read actions to the
+    serializer, which prunes its fields to them, so the query plan only
+    loads the rendered columns and relations.
+    """
+    sparse_fieldset_actions = ('list', 'retrieve')
+
+    def _field_names(self, param):
+        value = self.request.query_params.get(param, '')
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_fieldset_actions:
+            kwargs.setdefault('fields', self._field_names('fields'))
+            kwargs.setdefault('expand', self._field_names('expand'))
+        return super().get_serializer(*args, **kwargs)
+
+
+class ConditionalRequestMixin:
+    """
+    Validate conditional requests against the user's collection version
+    and serve unconditional ones from the rendered response cache.
+
+    Versions are bumped by the signal handlers in core.signals, so any
+    write makes earlier ETags, Last-Modified values and cache keys stale.
+    """
+    cacheable_formats = ('json',)
+
+    def get_collection_version(self):
+        """Return (version, modified) of the user's collection"""
+        if not hasattr(self, '_collection_version'):
+            self._collection_version = CollectionVersion.objects.current(
+                self.request.user)
+        return self._collection_version
+
+    def make_etag(self, *parts):
+        request = self.request
+        key = '|'.join(str(part) for part in (
+            request.user.pk,
+            # Cached bodies hold absolute pagination links
+            request.build_absolute_uri(),
+            request.accepted_renderer.format,
+            *parts,
+        ))
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def _last_modified(self):
+        """
+        Return the collection modification time in whole seconds and
+        whether it may be advertised yet.
+
+        The time is only advertised once its second has passed so a later
+        write within the same second can never validate a stale copy.
+        """
+        _, modified = self.get_collection_version()
+        if modified is None:
+            return None, False
+        last_modified = int(modified.timestamp())
+        return last_modified, last_modified < int(time.time())
+
+    def conditional_response(self, request, etag, handler, *args, **kwargs):
+        """Return 304 if the client copy is current, else call handler"""
+        last_modified, advertise = self._last_modified()
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.cached_response(
+                etag, handler, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if advertise:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def cached_response(self, key, handler, request, *args, **kwargs):
+        """Return the cached rendering for key, else call handler"""
+        if request.accepted_renderer.format not in self.cacheable_formats:
+            return handler(request, *args, **kwargs)
+
+        cached = response_cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Cache'] = 'hit'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['X-Cache'] = 'miss'
+            response.add_post_render_callback(
+                partial(self._store_response, key))
+        return response
+
+    def _store_response(self, key, response):
+        content = bytes(response.content)
+        response_cache.set(
+            key, (content, response['Content-Type']), size=len(content))
+
+
+class ConditionalListMixin(ConditionalRequestMixin):
+    """
+    Answer conditional list requests without querying the rows.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.make_etag('list', *self.get_collection_version()),
+            super().list, *args, **kwargs)
+
+
+class ConditionalRetrieveMixin(ConditionalRequestMixin):
+    """
+    Answer conditional retrieve requests from the object's version column.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            version = self.get_queryset().prefetch_related(None).filter(
+                **{self.lookup_field: lookup}
+            ).values_list('version', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            # Malformed lookups are answered 404 by get_object()
+            version = None
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, self.make_etag('detail', lookup, version),
+            super().retrieve, *args, **kwargs)
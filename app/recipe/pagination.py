@@ -0,0 +1,20 @@
+"""
+Pagination for the recipe APIs
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the newest-first id ordering.
+
+    Each page is a single indexed range scan from the cursor position, so
+    the cost of a page does not depend on how many rows precede it. The
+    default page size comes from settings.API_PAGE_SIZE and clients may
+    ask for up to max_page_size rows with ?page_size=.
+    """
+    ordering = '-id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
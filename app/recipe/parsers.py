@@ -0,0 +1,86 @@
+"""
+Incremental parsers for recipe import uploads
+"""
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class RowParseError(ParseError):
+    """A malformed row, with its 1-based position among the rows"""
+
+    def __init__(self, row, message):
+        super().__init__('Row %d: %s' % (row, message))
+        self.row = row
+
+
+class StreamingParser(BaseParser):
+    """
+    Parse the request body lazily into an iterator of row dictionaries.
+
+    The body is read a line at a time as the rows are consumed, so uploads
+    of any size are never held in memory. Malformed rows raise
+    RowParseError when they are reached.
+    """
+
+    def _lines(self, stream, media_type, parser_context):
+        if stream is None:
+            return iter(())
+        encoding = (parser_context or {}).get(
+            'encoding', settings.DEFAULT_CHARSET)
+        return codecs.iterdecode(stream, encoding)
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self.rows(self._lines(stream, media_type, parser_context))
+
+
+class NDJSONParser(StreamingParser):
+    """One JSON object per line, blank lines are skipped"""
+    media_type = 'application/x-ndjson'
+
+    def rows(self, lines):
+        row = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                item = json.loads(line)
+            except ValueError as exc:
+                raise RowParseError(row, 'Invalid JSON: %s' % exc)
+            if not isinstance(item, dict):
+                raise RowParseError(row, 'Expected a JSON object.')
+            yield item
+
+
+class CSVParser(StreamingParser):
+    """
+    CSV with a header row naming the fields. The tags column holds a JSON
+    array of tag names, as written by the CSV export.
+    """
+    media_type = 'text/csv'
+
+    def rows(self, lines):
+        reader = csv.DictReader(lines)
+        try:
+            for row, item in enumerate(reader, start=1):
+                if item.get('tags'):
+                    item['tags'] = self._tags(row, item['tags'])
+                else:
+                    item.pop('tags', None)
+                yield item
+        except csv.Error as exc:
+            raise RowParseError(reader.line_num, str(exc))
+
+    def _tags(self, row, value):
+        try:
+            names = json.loads(value)
+        except ValueError:
+            names = None
+        if not isinstance(names, list):
+            raise RowParseError(row, 'Expected tags as a JSON array.')
+        return [{'name': name} for name in names]
@@ -1,40 +1,138 @@
+from core.metrics import TimedSerializerMixin
 from core.models import (
     Recipe,
+    RecipeImport,
     Tag,
+    tag_key,
 )
+from core.signals import batched_changes
 from rest_framework import serializers
 
+from recipe import bulk
 
-class TagSerializer(serializers.ModelSerializer):
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """List serializer reporting its rendering time to the metrics."""
+
+
+class SparseFieldsMixin:
+    """
+    Serializer rendering a chosen subset of its fields.
+
+    The fields argument names the fields to render instead of the default
+    ones and expand names fields to add, such as Meta.expandable_fields
+    which are left out unless asked for. Unknown names raise a
+    ValidationError keyed by the argument naming them.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selected_fields = fields or []
+        self.expanded_fields = expand or []
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for param, names in (
+                ('fields', self.selected_fields),
+                ('expand', self.expanded_fields)):
+            unknown = [name for name in names if name not in fields]
+            if unknown:
+                raise serializers.ValidationError({
+                    param: ['Unknown fields: %s.' % ', '.join(unknown)]
+                })
+        selected = set(self.selected_fields or (
+            set(fields) - set(getattr(self.Meta, 'expandable_fields', []))))
+        selected.update(self.expanded_fields)
+        return {
+            name: field for name, field in fields.items() if name in selected
+        }
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
         read_only_fields = ['id']
+        list_serializer_class = TimedListSerializer
+
+    def validate_name(self, value):
+        """
+        Reject renaming a tag to the name of another of the user's tags,
+        compared by tag_key() as names are looked up by it.
+        """
+        # Nested in recipes, names pick existing tags instead
+        if self.parent is not None:
+            return value
+        duplicates = Tag.objects.filter(
+            user=self.context['request'].user, key=tag_key(value))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError(
+                'You already have a tag with this name.')
+        return value
+
+
+class TagStatsSerializer(TagSerializer):
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = fields
+
+
+class TagMergeSerializer(serializers.Serializer):
+    """Ids of the user's tags to fold into another tag."""
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+
+    def validate_tags(self, value):
+        tags = list(Tag.objects.filter(
+            user=self.context['request'].user, pk__in=value))
+        missing = set(value) - {tag.pk for tag in tags}
+        if missing:
+            raise serializers.ValidationError(
+                'Unknown tags: %s.' % ', '.join(map(str, sorted(missing))))
+        return tags
+
+
+class RecipeListSerializer(TimedListSerializer):
+    """Create many recipes with batched inserts."""
+
+    def create(self, validated_data):
+        # save(user=...) sets the same user on every item
+        user = (
+            validated_data[0]['user'] if validated_data
+            else self.context['request'].user
+        )
+        return bulk.create_recipes(
+            user,
+            [
+                {key: value for key, value in item.items() if key != 'user'}
+                for item in validated_data
+            ],
+        )
 
-class RecipeSerializer(serializers.ModelSerializer):
+
+class RecipeSerializer(
+        SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, required=False)
 
     class Meta:
         model = Recipe
         fields = ['id','title', 'time_minutes','price', 'link', 'tags']
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
 
     def _get_or_create_tags(self, tags, recipe):
         """Handle getting or creating tags as needed."""
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user = auth_user,
-                **tag,
-                #name=tag['name']
-            )
-            recipe.tags.add(tag_obj)
+        bulk.attach_tags(auth_user, [(recipe, [tag['name'] for tag in tags])])
 
 
     def create(self, validated_data):
         tags = validated_data.pop('tags',[])
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
+        with batched_changes(validated_data['user']):
+            recipe = Recipe.objects.create(**validated_data)
+            self._get_or_create_tags(tags, recipe)
 
         return recipe
 
@@ -42,19 +140,121 @@ class RecipeSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         """Update recipe."""
         tags = validated_data.pop('tags', None)
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+        with batched_changes(instance.user_id):
+            if tags is not None:
+                # Only the links that changed are written
+                bulk.set_tags(
+                    self.context['request'].user,
+                    [(instance, [tag['name'] for tag in tags])],
+                )
 
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
 
-        instance.save()
+            instance.save()
         return instance
 
 
+class FastRecipeListSerializer(TimedListSerializer):
+    """
+    Read-only list serializer rendering recipes from values() rows.
+
+    Produces the same output as RecipeSerializer(many=True) without
+    building model instances: scalar columns are copied straight from the
+    row (only converted where the field changes the value, e.g. price),
+    and tags for the whole page come from a single through-table query.
+    """
+    passthrough_fields = (serializers.CharField, serializers.IntegerField)
+
+    def _columns(self):
+        """
+        Return (name, source, converter) for each rendered field in order,
+        with a None source standing for the nested tags.
+        """
+        columns = []
+        for name, field in self.child.fields.items():
+            if field.write_only:
+                continue
+            if name == 'tags':
+                columns.append((name, None, None))
+                continue
+            convert = None
+            if type(field) not in self.passthrough_fields:
+                convert = field.to_representation
+            columns.append((name, field.source, convert))
+        return columns
+
+    def _tag_map(self, recipe_ids):
+        """Return the tag representations of each recipe, by recipe id."""
+        tags = {}
+        rows = (
+            Recipe.tags.through.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by('tag_id')
+            .values_list('recipe_id', 'tag_id', 'tag__name')
+        )
+        for recipe_id, tag_id, name in rows:
+            tags.setdefault(recipe_id, []).append(
+                {'id': tag_id, 'name': name})
+        return tags
+
+    def to_representation(self, data):
+        rows = list(data)
+        columns = self._columns()
+        tags = {}
+        if any(source is None for _, source, _ in columns):
+            tags = self._tag_map([row['id'] for row in rows])
+
+        output = []
+        for row in rows:
+            item = {}
+            for name, source, convert in columns:
+                if source is None:
+                    item[name] = tags.get(row['id'], [])
+                    continue
+                value = row[source]
+                if convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            output.append(item)
+        return output
+
+
+class FastRecipeSerializer(RecipeSerializer):
+    """
+    Recipe listing rendered through FastRecipeListSerializer, with the
+    description only rendered when expanded.
+    """
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['description']
+        expandable_fields = ['description']
+        list_serializer_class = FastRecipeListSerializer
+
+    def plan_queryset(self, queryset):
+        """Select the rendered columns as plain dictionaries."""
+        # The id is always selected to look the tags up by
+        return queryset.values(*dict.fromkeys(['id'] + [
+            field.source for name, field in self.fields.items()
+            if not field.write_only and name != 'tags'
+        ]))
+
+
 class RecipeDetailSerializer(RecipeSerializer):
      class Meta(RecipeSerializer.Meta):
         fields = RecipeSerializer.Meta.fields + ['description']
 
 
+class ExportRecipeSerializer(FastRecipeSerializer):
+    """Recipe detail fields rendered from values() rows for exports."""
+
+    class Meta(FastRecipeSerializer.Meta):
+        fields = RecipeDetailSerializer.Meta.fields
+        expandable_fields = []
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecipeImport
+        fields = ['id', 'status', 'rows', 'errors', 'created', 'modified']
+        read_only_fields = fields
@@ -0,0 +1,124 @@
+"""
+Background jobs for the recipe APIs
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import HttpRequest
+from rest_framework import serializers as drf_serializers
+from rest_framework.request import Request
+
+from core.jobs import task
+from core.models import Recipe, RecipeImport
+from recipe import export, imports, serializers
+from recipe.parsers import CSVParser, NDJSONParser
+
+
+PARSERS = {'ndjson': NDJSONParser, 'csv': CSVParser}
+FORMATS = {parser: output for output, parser in PARSERS.items()}
+
+
+class ExportArgsSerializer(drf_serializers.Serializer):
+    output = drf_serializers.ChoiceField(
+        choices=list(export.FORMATS), default='ndjson')
+
+
+@task('recipe.export', public=True, args_serializer=ExportArgsSerializer)
+def export_recipes(context, output='ndjson'):
+    """
+    Write the user's whole collection to a file in the default storage,
+    reporting progress once per chunk.
+    """
+    user = context.job.user
+    queryset = Recipe.objects.filter(user=user).order_by('-id')
+    serializer = serializers.ExportRecipeSerializer(many=True)
+    total = queryset.count()
+    context.progress(0, total)
+
+    def pages():
+        done = 0
+        for page in export.iter_pages(
+                serializer.child.plan_queryset(queryset), serializer,
+                settings.API_EXPORT_CHUNK_SIZE):
+            yield page
+            done += len(page)
+            context.progress(done)
+
+    if output == 'csv':
+        stream = export.csv_stream(pages(), list(serializer.child.fields))
+    else:
+        stream = export.ndjson_stream(pages())
+
+    _, extension = export.FORMATS[output]
+    with tempfile.TemporaryFile() as file:
+        for text in stream:
+            file.write(text.encode())
+        file.seek(0)
+        name = default_storage.save(
+            'exports/%d.%s' % (context.job.pk, extension), File(file))
+    return {'file': name, 'rows': total}
+
+
+@task('recipe.import')
+def import_recipes(context, import_id, file, output='ndjson'):
+    """
+    Run a RecipeImport from an upload saved in the default storage. The
+    upload is deleted once the import completes; otherwise it is kept for
+    retries of the job and deleted by the clean_job_files command.
+    """
+    recipe_import = RecipeImport.objects.select_related('user').get(
+        pk=import_id)
+
+    def counted(items):
+        done = 0
+        for done, item in enumerate(items, start=1):
+            if done % settings.API_IMPORT_BATCH_SIZE == 0:
+                context.progress(done)
+            yield item
+        context.progress(done)
+
+    with default_storage.open(file, 'rb') as upload:
+        imports.import_rows(
+            recipe_import,
+            counted(PARSERS[output]().parse(upload)),
+            serializers.RecipeDetailSerializer,
+            {'request': job_request(recipe_import.user)},
+            settings.API_IMPORT_BATCH_SIZE,
+        )
+    if recipe_import.status == RecipeImport.COMPLETED:
+        default_storage.delete(file)
+    return {
+        'import': recipe_import.pk,
+        'status': recipe_import.status,
+        'rows': recipe_import.rows,
+        'errors': recipe_import.errors,
+    }
+
+
+def job_request(user):
+    """
+    Return a request made by user, for serializers reading the user from
+    context['request'] outside of a view.
+    """
+    request = Request(HttpRequest())
+    request.user = user
+    return request
+
+
+def save_upload(stream, name):
+    """Copy a request body to name in the default storage in chunks"""
+    with tempfile.TemporaryFile() as file:
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            file.write(chunk)
+        file.seek(0)
+        return default_storage.save(name, File(file))
+
+
+def upload_name(recipe_import, output):
+    return os.path.join('imports', '%d.%s' % (recipe_import.pk, output))
@@ -0,0 +1,134 @@
+"""
+Tests for the async recipe API views
+"""
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import benchmarks
+from core.models import Recipe, Tag
+from recipe.mixins import response_cache
+from recipe.views import RecipeViewSet
+from user.authentication import token_cache
+
+
+ASYNC_RECIPES_URL = reverse('recipe:async-recipe-list')
+ASYNC_TAGS_URL = reverse('recipe:async-tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def async_detail_url(recipe_id):
+    return reverse('recipe:async-recipe-detail', args=[recipe_id])
+
+
+class AsyncRecipeAPITests(TransactionTestCase):
+    """
+    The async views run the ORM on worker threads with their own
+    connections, so data has to be committed for them to see it.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpassword123')
+        self.client = APIClient()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30,
+            price=Decimal('7.50'))
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+
+    def test_auth_required(self):
+        res = APIClient().get(ASYNC_RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_list_matches_sync_view(self):
+        res = self.client.get(ASYNC_RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), self.client.get(RECIPES_URL).json())
+
+    def test_runs_on_db_thread(self):
+        threads = []
+        get_queryset = RecipeViewSet.get_queryset
+
+        def record(view):
+            threads.append(threading.current_thread().name)
+            return get_queryset(view)
+
+        with patch.object(RecipeViewSet, 'get_queryset', record):
+            self.client.get(async_detail_url(self.recipe.id))
+
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('async-db') for name in threads))
+
+    def test_asgi_requests_run_concurrently(self):
+        """Test no middleware queues ASGI requests on one thread."""
+        get_queryset = RecipeViewSet.get_queryset
+
+        def slow(view):
+            time.sleep(0.3)
+            return get_queryset(view)
+
+        with patch.object(RecipeViewSet, 'get_queryset', slow):
+            result = benchmarks.load_test_asgi(
+                get_asgi_application(), async_detail_url(self.recipe.id),
+                self.token.key, requests=4, concurrency=4)
+
+        self.assertEqual(result['errors'], 0)
+        # One at a time the four requests would take 1.2 seconds
+        self.assertLess(4 / result['throughput_rps'], 0.9)
+
+    def test_retrieve(self):
+        res = self.client.get(async_detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Curry')
+        self.assertEqual(res.data['tags'][0]['name'], 'Dinner')
+
+    def test_retrieve_other_users_recipe(self):
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpassword123')
+        recipe = Recipe.objects.create(
+            user=other, title='Soup', time_minutes=10, price=Decimal('2.00'))
+
+        res = self.client.get(async_detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_create(self):
+        payload = {
+            'title': 'Pancakes',
+            'time_minutes': 15,
+            'price': '3.20',
+            'tags': [{'name': 'Breakfast'}],
+        }
+
+        res = self.client.post(ASYNC_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(
+            list(recipe.tags.values_list('name', flat=True)), ['Breakfast'])
+
+    def test_list_tags(self):
+        res = self.client.get(ASYNC_TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']], ['Dinner'])
@@ -1,19 +1,36 @@
 """
 Tests for the recipe API
 """
+import csv
+import io
+import json
+import tempfile
 from decimal import Decimal
-from django.test import TestCase
+from unittest.mock import patch
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
-from core.models import Recipe, Tag
+from core import jobs
+from core.models import Job, Recipe, RecipeImport, Tag
 from recipe.serializers import RecipeSerializer
 from recipe.serializers import RecipeDetailSerializer
+from core.tests.helpers import QueryBudgetMixin
+from recipe import imports
+from recipe.mixins import plan_queryset, response_cache
 
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+EXPORT_URL = reverse('recipe:recipe-export')
+IMPORT_URL = reverse('recipe:recipe-import')
 
 
 def detail_url(recipe_id):
@@ -47,9 +64,10 @@ class PublicRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateRecipeTests(TestCase):
+class PrivateRecipeTests(QueryBudgetMixin, TestCase):
     def setUp(self):
         # create a user and authenticate
+        response_cache.clear()
         self.user = create_user(email='test@example.com', password='testpassword123')
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
@@ -64,7 +82,7 @@ class PrivateRecipeTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
 
     def test_recipe_list_lmt_to_usr(self):
@@ -77,7 +95,7 @@ class PrivateRecipeTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_detail(self):
         recipe = create_recipe(user=self.user)
@@ -251,6 +269,45 @@ class PrivateRecipeTests(TestCase):
         self.assertIn(tag_lunch, recipe.tags.all())
         self.assertNotIn(tag_breakfast, recipe.tags.all()) #tag?
 
+    def test_update_recipe_tags_writes_changed_links_only(self):
+        """Test updating tags keeps the links of tags that stay."""
+        recipe = create_recipe(user=self.user)
+        kept = Tag.objects.create(user=self.user, name='Vegan')
+        dropped = Tag.objects.create(user=self.user, name='Dinner')
+        recipe.tags.add(kept, dropped)
+        RecipeTag = Recipe.tags.through
+        kept_link = RecipeTag.objects.get(recipe=recipe, tag=kept)
+        payload = {'tags': [{'name': 'Vegan'}, {'name': 'Quick'}]}
+
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(RecipeTag.objects.filter(pk=kept_link.pk).exists())
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Quick', 'Vegan'])
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'recipe_count')),
+            {'Vegan': 1, 'Dinner': 0, 'Quick': 1})
+
+    def test_update_unchanged_recipe_tags_writes_no_links(self):
+        """Test sending the current tags again leaves the links alone."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        payload = {'title': 'Renamed', 'tags': [{'name': 'Vegan'}]}
+
+        with CaptureQueriesContext(connection) as captured:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        link_writes = [
+            query['sql'] for query in captured.captured_queries
+            if Recipe.tags.through._meta.db_table in query['sql']
+            and not query['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(link_writes, [])
+
     def test_clear_recipe_tags(self):
         """Test clearing a recipes tags."""
         tag = Tag.objects.create(user=self.user, name='Dessert')
@@ -264,6 +321,668 @@ class PrivateRecipeTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.tags.count(), 0)
 
+    def test_recipe_list_query_budget(self):
+        """Test listing recipes costs the same queries for any size."""
+        for i in range(10):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}'),
+                Tag.objects.create(user=self.user, name=f'Other {i}'),
+            )
+
+        res = self.assertQueryBudget(3, 'get', RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_recipe_detail_malformed_id(self):
+        res = self.client.get(RECIPES_URL + 'abc/')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_recipe_detail_query_budget(self):
+        """Test retrieving a recipe prefetches its tags."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        res = self.assertQueryBudget(4, 'get', detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, RecipeDetailSerializer(recipe).data)
+
+    def test_recipe_list_paginated(self):
+        """Test recipes are listed newest first one cursor page at a time."""
+        recipes = [
+            create_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(5)
+        ]
+        expected = [recipe.id for recipe in reversed(recipes)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids, expected)
+        self.assertIsNone(res.data['next'])
+        self.assertIsNotNone(res.data['previous'])
+
+    def test_create_recipe_with_many_tags_query_budget(self):
+        """Test tags are resolved and attached in a fixed number of queries."""
+        Tag.objects.create(user=self.user, name='Tag 0')
+        payload = {
+            'title': 'Tagged recipe',
+            'time_minutes': 30,
+            'price': Decimal('2.50'),
+            'tags': [{'name': f'Tag {i}'} for i in range(30)],
+        }
+
+        res = self.assertQueryBudget(
+            12, 'post', RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 30)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 30)
+        self.assertEqual(len(res.data['tags']), 30)
+
+    def test_bulk_create_recipes(self):
+        """Test creating a list of recipes with shared and new tags."""
+        Tag.objects.create(user=self.user, name='Dinner')
+        payload = [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10 + i,
+                'price': '1.50',
+                'description': f'Description {i}',
+                'tags': [{'name': 'Dinner'}, {'name': f'Tag {i}'}],
+            }
+            for i in range(5)
+        ]
+
+        res = self.assertQueryBudget(
+            20, 'post', BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [recipe['title'] for recipe in res.data],
+            [item['title'] for item in payload],
+        )
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 6)
+        for recipe, item in zip(recipes, payload):
+            self.assertEqual(recipe.description, item['description'])
+            self.assertEqual(
+                set(recipe.tags.values_list('name', flat=True)),
+                {tag['name'] for tag in item['tags']},
+            )
+
+    def test_bulk_create_reports_item_errors(self):
+        """Test nothing is created when any item is invalid."""
+        payload = [
+            {'title': 'Valid', 'time_minutes': 5, 'price': '1.00'},
+            {'title': 'Missing price', 'time_minutes': 5},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('price', res.data[1])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_update_recipes(self):
+        """Test partially updating a list of recipes."""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        first = create_recipe(user=self.user, title='First')
+        second = create_recipe(user=self.user, title='Second')
+        first.tags.add(tag)
+        payload = [
+            {'id': first.id, 'tags': [{'name': 'Lunch'}]},
+            {'id': second.id, 'title': 'Second updated'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.title, 'First')
+        self.assertEqual(
+            list(first.tags.values_list('name', flat=True)), ['Lunch'])
+        self.assertEqual(second.title, 'Second updated')
+
+    def test_bulk_update_other_users_recipe_error(self):
+        other_user = create_user(
+            email='other@example.com', password='pass12345')
+        recipe = create_recipe(user=other_user, title='Theirs')
+        payload = [{'id': recipe.id, 'title': 'Mine now'}]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data[0])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Theirs')
+
+    def test_bulk_update_bool_id_error(self):
+        recipe = create_recipe(user=self.user, title='Mine')
+        Recipe.objects.filter(pk=recipe.pk).update(id=1)
+        payload = [{'id': True, 'title': 'Renamed'}]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data[0])
+        self.assertEqual(Recipe.objects.get(id=1).title, 'Mine')
+
+    def test_bulk_delete_recipes(self):
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        payload = [recipe.id for recipe in recipes[:2]]
+
+        res = self.client.delete(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            list(Recipe.objects.filter(user=self.user)), [recipes[2]])
+
+    def test_bulk_delete_other_users_recipe_error(self):
+        other_user = create_user(
+            email='other@example.com', password='pass12345')
+        theirs = create_recipe(user=other_user)
+        mine = create_recipe(user=self.user)
+
+        res = self.client.delete(BULK_URL, [mine.id, theirs.id], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_bulk_delete_bool_id_error(self):
+        recipe = create_recipe(user=self.user)
+        Recipe.objects.filter(pk=recipe.pk).update(id=1)
+
+        res = self.client.delete(BULK_URL, [True], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(id=1).exists())
+
+    def test_filter_by_tags(self):
+        """Test filtering recipes by tag ids."""
+        r1 = create_recipe(user=self.user, title='Thai Vegetable Curry')
+        r2 = create_recipe(user=self.user, title='Aubergine with Tahini')
+        r3 = create_recipe(user=self.user, title='Fish and chips')
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Vegetarian')
+        r1.tags.add(tag1)
+        r2.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        ids = [recipe['id'] for recipe in res.data['results']]
+        self.assertEqual(ids, [r2.id, r1.id])
+        self.assertNotIn(r3.id, ids)
+
+    def test_filter_by_price_and_time(self):
+        cheap_quick = create_recipe(
+            user=self.user, price=Decimal('2.00'), time_minutes=10)
+        create_recipe(user=self.user, price=Decimal('9.00'), time_minutes=10)
+        create_recipe(user=self.user, price=Decimal('2.00'), time_minutes=60)
+        create_recipe(user=self.user, price=Decimal('0.50'), time_minutes=10)
+
+        res = self.client.get(RECIPES_URL, {
+            'min_price': '1.00',
+            'max_price': '5.00',
+            'max_time': '30',
+        })
+
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [cheap_quick.id],
+        )
+
+    def test_search_title_and_description(self):
+        by_title = create_recipe(user=self.user, title='Spicy Ramen')
+        by_description = create_recipe(
+            user=self.user, title='Noodles', description='A spicy broth')
+        create_recipe(user=self.user, title='Porridge')
+
+        res = self.client.get(RECIPES_URL, {'search': 'SPICY'})
+
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [by_description.id, by_title.id],
+        )
+
+    def test_invalid_filter_returns_error(self):
+        res = self.client.get(RECIPES_URL, {'tags': 'one,two'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+    def test_out_of_range_filters_return_error(self):
+        """Test numbers the database cannot compare are rejected."""
+        for name, value in (
+                ('max_time', '99999999999999999999999'),
+                ('min_price', 'Infinity'),
+                ('max_price', 'NaN'),
+                ('tags', '1,99999999999999999999999')):
+            res = self.client.get(RECIPES_URL, {name: value})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(name, res.data)
+
+    def test_list_not_modified(self):
+        """Test an unchanged list is answered with 304 from its ETag."""
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_list_etag_changes_on_write(self):
+        recipe = create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        self.client.patch(detail_url(recipe.id), {'title': 'Changed'})
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['results'][0]['title'], 'Changed')
+
+    def test_list_etag_depends_on_query(self):
+        create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(
+            RECIPES_URL, {'search': 'x'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_detail_not_modified_until_tag_renamed(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(
+            reverse('recipe:tag-detail', args=[tag.id]), {'name': 'Plant'})
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Plant')
+
+    def test_list_served_from_response_cache(self):
+        """Test a repeated list is served from cached rendered bytes."""
+        create_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL)
+        hits = response_cache.hits
+
+        with self.assertNumQueries(1):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first['X-Cache'], 'miss')
+        self.assertEqual(second['X-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+        self.assertEqual(response_cache.hits, hits + 1)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_response_cache_keyed_by_host_and_scheme(self):
+        """Test responses are not shared across hosts and schemes."""
+        create_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL)
+
+        other_host = self.client.get(
+            RECIPES_URL, HTTP_HOST='api.example.com')
+        https = self.client.get(RECIPES_URL, secure=True)
+
+        self.assertEqual(other_host['X-Cache'], 'miss')
+        self.assertEqual(https['X-Cache'], 'miss')
+        self.assertEqual(
+            len({first['ETag'], other_host['ETag'], https['ETag']}), 3)
+
+    def test_response_cache_invalidated_by_model_changes(self):
+        """Test writes outside the API invalidate cached responses."""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(RECIPES_URL)
+        self.client.get(detail_url(recipe.id))
+
+        recipe.tags.add(tag)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res['X-Cache'], 'miss')
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Vegan')
+
+        tag.name = 'Plant based'
+        tag.save()
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res['X-Cache'], 'miss')
+        self.assertEqual(res.data['tags'][0]['name'], 'Plant based')
+
+    def test_fast_list_matches_recipe_serializer(self):
+        """Test the list fast path renders the same bytes as the serializer."""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Dinner', 'Quick')
+        ]
+        for i, price in enumerate(['0.50', '10.00', '999.99']):
+            recipe = create_recipe(
+                user=self.user, title=f'Recipe {i}', price=Decimal(price),
+                link='' if i else 'https://example.com')
+            recipe.tags.add(*reversed(tags[:i + 1]))
+
+        res = self.client.get(RECIPES_URL)
+
+        serializer = RecipeSerializer(many=True)
+        serializer.instance = plan_queryset(
+            Recipe.objects.filter(user=self.user).order_by('-id'), serializer)
+        expected = JSONRenderer().render({
+            'next': None,
+            'previous': None,
+            'results': serializer.data,
+        })
+        self.assertEqual(res.content, expected)
+
+    def test_list_sparse_fields_skip_tags(self):
+        """Test ?fields= prunes the output and the tag query."""
+        recipe = create_recipe(user=self.user, title='Soup')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['results'], [{'id': recipe.id, 'title': 'Soup'}])
+        for query in context.captured_queries:
+            self.assertNotIn('core_recipe_tags', query['sql'])
+            self.assertNotIn('"price"', query['sql'])
+
+    def test_list_expand_description(self):
+        """Test ?expand= adds the description to the default fields."""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'expand': 'description'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        item = res.data['results'][0]
+        self.assertEqual(item['description'], recipe.description)
+        self.assertEqual(
+            list(item), RecipeDetailSerializer.Meta.fields)
+
+    def test_list_sparse_fields_with_tags(self):
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+
+        res = self.client.get(RECIPES_URL, {'fields': 'tags'})
+
+        self.assertEqual(
+            res.data['results'],
+            [{'tags': [{'id': tag.id, 'name': 'Vegan'}]}])
+
+    def test_detail_sparse_fields(self):
+        """Test ?fields= on a recipe narrows the loaded columns."""
+        recipe = create_recipe(user=self.user, title='Soup')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(detail_url(recipe.id), {'fields': 'title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'title': 'Soup'})
+        for query in context.captured_queries:
+            self.assertNotIn('core_recipe_tags', query['sql'])
+            self.assertNotIn('"description"', query['sql'])
+
+    def test_sparse_fields_unknown(self):
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'fields': 'title,secret'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['fields'], ['Unknown fields: secret.'])
+
+        res = self.client.get(detail_url(recipe.id), {'expand': 'user'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', res.data)
+
+    def test_export_sparse_fields(self):
+        create_recipe(user=self.user, title='Soup')
+
+        res = self.client.get(
+            EXPORT_URL, {'output': 'csv', 'fields': 'title,price'})
+
+        rows = list(csv.reader(
+            io.StringIO(b''.join(res.streaming_content).decode())))
+        self.assertEqual(rows, [['title', 'price'], ['Soup', '5.25']])
+
+    @override_settings(API_EXPORT_CHUNK_SIZE=2)
+    def test_export_ndjson_streams_in_chunks(self):
+        """Test the export streams every recipe with one tag query a chunk."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        for i in range(5):
+            create_recipe(user=self.user, title=f'Recipe {i}').tags.add(tag)
+        create_recipe(user=create_user(email='other@example.com'))
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(EXPORT_URL)
+            content = b''.join(res.streaming_content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(
+            res['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        self.assertEqual(
+            [json.loads(line) for line in content.decode().splitlines()],
+            RecipeDetailSerializer(recipes, many=True).data,
+        )
+        tag_queries = [
+            query for query in context.captured_queries
+            if 'core_recipe_tags' in query['sql']
+        ]
+        self.assertEqual(len(tag_queries), 3)
+
+    def test_export_csv_applies_filters(self):
+        """Test the CSV export writes the filtered recipes with tag names."""
+        recipe = create_recipe(user=self.user, title='Spicy, "hot" soup')
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Dinner'),
+            Tag.objects.create(user=self.user, name='Vegan'),
+        )
+        create_recipe(user=self.user, title='Cake')
+
+        res = self.client.get(EXPORT_URL, {'output': 'csv', 'search': 'soup'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['Content-Disposition'], 'attachment; filename="recipes.csv"')
+        rows = list(csv.DictReader(
+            io.StringIO(b''.join(res.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Spicy, "hot" soup')
+        self.assertEqual(rows[0]['price'], '5.25')
+        self.assertEqual(json.loads(rows[0]['tags']), ['Dinner', 'Vegan'])
+
+    def test_export_unknown_output(self):
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('output', res.data)
+
+    def _ndjson(self, items):
+        return ''.join(json.dumps(item) + '\n' for item in items)
+
+    @override_settings(API_IMPORT_BATCH_SIZE=2)
+    def test_import_ndjson_in_batches(self):
+        """Test an NDJSON upload is committed in batches with its tags."""
+        items = [
+            {'title': f'Recipe {i}', 'time_minutes': 5, 'price': '1.50',
+             'tags': [{'name': 'Vegan'}, {'name': f'Tag {i}'}]}
+            for i in range(5)
+        ]
+
+        res = self.client.post(
+            IMPORT_URL, self._ndjson(items),
+            content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['status'], RecipeImport.COMPLETED)
+        self.assertEqual(res.data['rows'], 5)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            [recipe.title for recipe in recipes],
+            [item['title'] for item in items])
+        self.assertEqual(
+            sorted(tag.name for tag in recipes[4].tags.all()),
+            ['Tag 4', 'Vegan'])
+
+    @override_settings(API_IMPORT_BATCH_SIZE=2)
+    def test_import_stops_at_invalid_batch_and_resumes(self):
+        """Test a failed import keeps earlier batches and can be resumed."""
+        items = [
+            {'title': f'Recipe {i}', 'time_minutes': 5, 'price': '1.50'}
+            for i in range(5)
+        ]
+        items[3]['price'] = 'cheap'
+
+        res = self.client.post(
+            IMPORT_URL, self._ndjson(items),
+            content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['status'], RecipeImport.FAILED)
+        self.assertEqual(res.data['rows'], 2)
+        self.assertEqual(res.data['errors'][0]['row'], 4)
+        self.assertIn('price', res.data['errors'][0]['errors'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+        items[3]['price'] = '2.00'
+        res = self.client.post(
+            f'{IMPORT_URL}?resume={res.data["id"]}', self._ndjson(items),
+            content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['rows'], 5)
+        self.assertEqual(
+            sorted(Recipe.objects.filter(user=self.user)
+                   .values_list('title', flat=True)),
+            [item['title'] for item in items])
+
+    def test_import_malformed_line(self):
+        res = self.client.post(
+            IMPORT_URL,
+            '{"title": "Soup", "time_minutes": 5, "price": "1.00"}\n{oops\n',
+            content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['errors'][0]['row'], 2)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_import_round_trips_csv_export(self):
+        """Test a CSV export imports back into an equal collection."""
+        recipe = create_recipe(user=self.user, title='Soup, "spicy"')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        create_recipe(user=self.user, title='Cake', link='')
+        exported = b''.join(
+            self.client.get(EXPORT_URL, {'output': 'csv'}).streaming_content)
+        other = create_user(email='other@example.com')
+        self.client.force_authenticate(other)
+
+        res = self.client.post(IMPORT_URL, exported, content_type='text/csv')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        fields = ['title', 'description', 'time_minutes', 'price', 'link']
+        self.assertEqual(
+            list(Recipe.objects.filter(user=other)
+                 .order_by('title').values(*fields)),
+            list(Recipe.objects.filter(user=self.user)
+                 .order_by('title').values(*fields)))
+        imported = Recipe.objects.get(user=other, title='Soup, "spicy"')
+        self.assertEqual(
+            [tag.name for tag in imported.tags.all()], ['Dinner'])
+
+    def test_resume_other_users_import(self):
+        other = create_user(email='other@example.com')
+        recipe_import = RecipeImport.objects.create(
+            user=other, status=RecipeImport.FAILED)
+
+        res = self.client.post(
+            f'{IMPORT_URL}?resume={recipe_import.id}', '',
+            content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_import_in_background(self):
+        """Test a background import is stored and run by a job."""
+        items = [
+            {'title': f'Recipe {i}', 'time_minutes': 5, 'price': '1.50'}
+            for i in range(3)
+        ]
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            res = self.client.post(
+                f'{IMPORT_URL}?background=true', self._ndjson(items),
+                content_type='application/x-ndjson')
+
+            self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+            self.assertFalse(Recipe.objects.exists())
+            with patch.object(
+                    imports, 'import_rows',
+                    wraps=imports.import_rows) as import_rows:
+                jobs.Worker('test').run(burst=True)
+
+        job = Job.objects.get(pk=res.data['id'])
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result['status'], RecipeImport.COMPLETED)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        context = import_rows.call_args.args[3]
+        self.assertEqual(context['request'].user, self.user)
+
+    def test_background_import_uploads_cleaned_up(self):
+        """Test uploads of failed and resumed imports are deleted."""
+        bad = [{'title': 'No time', 'price': '1.50'}]
+        good = [{'title': 'Soup', 'time_minutes': 5, 'price': '1.50'}]
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            res = self.client.post(
+                f'{IMPORT_URL}?background=true', self._ndjson(bad),
+                content_type='application/x-ndjson')
+            jobs.Worker('test').run(burst=True)
+            failed = Job.objects.get(pk=res.data['id'])
+            import_id = failed.result['import']
+            self.assertEqual(failed.result['status'], RecipeImport.FAILED)
+            self.assertTrue(default_storage.exists(failed.args['file']))
+
+            self.client.post(
+                f'{IMPORT_URL}?background=true&resume={import_id}',
+                self._ndjson(good), content_type='application/x-ndjson')
+            jobs.Worker('test').run(burst=True)
+            call_command('clean_job_files', '--max-age', '0',
+                         stdout=io.StringIO())
+
+            self.assertEqual(default_storage.listdir('imports'), ([], []))
+        failed.refresh_from_db()
+        self.assertNotIn('file', failed.args)
+        self.assertEqual(
+            RecipeImport.objects.get(pk=import_id).status,
+            RecipeImport.COMPLETED)
+
 
 
 
@@ -1,20 +1,33 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
-from core.models import Tag
+from core.models import Recipe, Tag
 from recipe.serializers import TagSerializer
+from core.tests.helpers import QueryBudgetMixin
+from recipe.mixins import response_cache
 
 
 TAG_URL = reverse('recipe:tag-list')
+STATS_URL = reverse('recipe:tag-stats')
+RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
 
 
 def detail_url(tag_id):
     return reverse('recipe:tag-detail', args=[tag_id])
 
 
+def merge_url(tag_id):
+    return reverse('recipe:tag-merge', args=[tag_id])
+
+
 def create_user(email='usertest@test.com', password="pass123abc456"):
     """Create and return a new user"""
     return get_user_model().objects.create_user(email, password)
@@ -35,9 +48,10 @@ class PublicTagAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateTagTests(TestCase):
+class PrivateTagTests(QueryBudgetMixin, TestCase):
     """test authenticated request"""
     def setUp(self):
+        response_cache.clear()
         self.client = APIClient()
         self.user = create_user()
         self.client.force_authenticate(self.user)
@@ -51,7 +65,7 @@ class PrivateTagTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
 
 
@@ -66,9 +80,9 @@ class PrivateTagTests(TestCase):
        res = self.client.get(TAG_URL)
 
        self.assertEqual(res.status_code, status.HTTP_200_OK)
-       self.assertEqual(len(res.data), 1)
-       self.assertEqual(res.data[0]['name'], tag.name)
-       self.assertEqual(res.data, serializer.data)
+       self.assertEqual(len(res.data['results']), 1)
+       self.assertEqual(res.data['results'][0]['name'], tag.name)
+       self.assertEqual(res.data['results'], serializer.data)
 
      # test detail, create_tag, update, delete
     def test_tag_update(self):
@@ -83,6 +97,40 @@ class PrivateTagTests(TestCase):
         self.assertEqual(res.data['name'],payload['name'])
 
 
+    def test_tag_update_duplicate_name(self):
+        """Test renaming a tag to an existing name is rejected"""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', res.data)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dinner')
+
+    def test_tag_update_case_variant_of_existing_name(self):
+        """Test renaming a tag to another tag's name in other case fails"""
+        Tag.objects.create(user=self.user, name='vegan')
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': ' VEGAN'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user, key='vegan').count(), 1)
+
+    def test_tag_update_same_name(self):
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Dinner'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'DINNER'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
     def test_delete_tag(self):
         tag = Tag.objects.create(user=self.user, name='Breakfast')
         url = detail_url(tag.id)
@@ -92,3 +140,198 @@ class PrivateTagTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Tag.objects.filter(id=tag.id).exists())
 
+    def test_tag_list_query_budget(self):
+        for i in range(10):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        res = self.assertQueryBudget(2, 'get', TAG_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 10)
+
+    def test_tag_list_page_size(self):
+        for i in range(3):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        res = self.client.get(TAG_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_tag_list_not_modified_until_delete(self):
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        etag = self.client.get(TAG_URL)['ETag']
+
+        res = self.client.get(TAG_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.delete(detail_url(tag.id))
+        res = self.client.get(TAG_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def _counts(self):
+        return dict(
+            Tag.objects.filter(user=self.user).values_list(
+                'name', 'recipe_count'))
+
+    def _recipe(self, tags):
+        payload = {
+            'title': 'Soup', 'time_minutes': 5, 'price': '1.00',
+            'tags': [{'name': name} for name in tags],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        return res.data['id']
+
+    def test_recipe_counts_follow_writes(self):
+        """Test every recipe write path keeps the tag counts current."""
+        first = self._recipe(['Vegan', 'Dinner'])
+        second = self._recipe(['Vegan'])
+        self.assertEqual(self._counts(), {'Vegan': 2, 'Dinner': 1})
+
+        self.client.patch(
+            reverse('recipe:recipe-detail', args=[first]),
+            {'tags': [{'name': 'Quick'}]}, format='json')
+        self.assertEqual(
+            self._counts(), {'Vegan': 1, 'Dinner': 0, 'Quick': 1})
+
+        self.client.post(BULK_URL, [
+            {'title': f'Bulk {i}', 'time_minutes': 5, 'price': '1.00',
+             'tags': [{'name': 'Quick'}, {'name': 'Vegan'}]}
+            for i in range(3)
+        ], format='json')
+        self.assertEqual(
+            self._counts(), {'Vegan': 4, 'Dinner': 0, 'Quick': 4})
+
+        self.client.patch(BULK_URL, [
+            {'id': second, 'tags': [{'name': 'Dinner'}]}], format='json')
+        self.assertEqual(
+            self._counts(), {'Vegan': 3, 'Dinner': 1, 'Quick': 4})
+
+        self.client.delete(reverse('recipe:recipe-detail', args=[first]))
+        bulk_ids = list(
+            Recipe.objects.filter(title__startswith='Bulk')
+            .values_list('id', flat=True))
+        self.client.delete(BULK_URL, bulk_ids[:2], format='json')
+        self.assertEqual(
+            self._counts(), {'Vegan': 1, 'Dinner': 1, 'Quick': 1})
+
+    def test_recipe_counts_follow_relation_changes(self):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('1.00'))
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+
+        recipe.tags.add(vegan, dinner)
+        recipe.tags.add(vegan)
+        self.assertEqual(self._counts(), {'Vegan': 1, 'Dinner': 1})
+        recipe.tags.remove(dinner)
+        self.assertEqual(self._counts(), {'Vegan': 1, 'Dinner': 0})
+        dinner.recipe_set.add(recipe)
+        self.assertEqual(self._counts(), {'Vegan': 1, 'Dinner': 1})
+        recipe.tags.clear()
+        self.assertEqual(self._counts(), {'Vegan': 0, 'Dinner': 0})
+
+    def test_tag_stats(self):
+        """Test the stats list the most used tags first."""
+        self._recipe(['Vegan', 'Dinner'])
+        self._recipe(['Vegan'])
+        self._recipe(['Quick', 'Vegan', 'Dinner'])
+        Tag.objects.create(user=create_user('other@test.com'), name='Vegan')
+
+        res = self.assertQueryBudget(4, 'get', STATS_URL, {'top': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(tag['name'], tag['recipe_count']) for tag in res.data],
+            [('Vegan', 3), ('Dinner', 2)])
+
+    def test_tag_stats_not_modified_until_write(self):
+        self._recipe(['Vegan'])
+        etag = self.client.get(STATS_URL)['ETag']
+
+        res = self.client.get(STATS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self._recipe(['Vegan'])
+        res = self.client.get(STATS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['recipe_count'], 2)
+
+    def test_tag_stats_invalid_top(self):
+        res = self.client.get(STATS_URL, {'top': 0})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_repair_tag_counts(self):
+        self._recipe(['Vegan', 'Dinner'])
+        self._recipe(['Vegan'])
+        Tag.objects.update(recipe_count=7)
+        out = StringIO()
+
+        call_command('repair_tag_counts', '--batch-size', '1', stdout=out)
+
+        self.assertEqual(self._counts(), {'Vegan': 2, 'Dinner': 1})
+        self.assertIn('Fixed 2 tag counts', out.getvalue())
+
+    def test_merge_tags(self):
+        """Test merging tags moves their recipes without duplicates."""
+        both = self._recipe(['Vegan', 'Vegan food'])
+        self._recipe(['Vegan food', 'Plant based'])
+        self._recipe(['Plant based'])
+        vegan, food, plant = (
+            Tag.objects.get(user=self.user, name=name)
+            for name in ('Vegan', 'Vegan food', 'Plant based'))
+        payload = {'tags': [food.id, plant.id]}
+
+        res = self.assertQueryBudget(
+            12, 'post', merge_url(vegan.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 3)
+        self.assertEqual(self._counts(), {'Vegan': 3})
+        self.assertEqual(
+            Recipe.tags.through.objects.filter(tag=vegan).count(), 3)
+        self.assertEqual(
+            list(Recipe.objects.get(id=both).tags.all()), [vegan])
+
+    def test_merge_tags_bumps_recipe_versions(self):
+        recipe_id = self._recipe(['Vegan food'])
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        food = Tag.objects.get(name='Vegan food')
+        version = Recipe.objects.get(id=recipe_id).version
+
+        self.client.post(
+            merge_url(vegan.id), {'tags': [food.id]}, format='json')
+
+        self.assertGreater(
+            Recipe.objects.get(id=recipe_id).version, version)
+
+    def test_merge_other_users_tag_rejected(self):
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        theirs = Tag.objects.create(
+            user=create_user('other@test.com'), name='Vegan food')
+
+        res = self.client.post(
+            merge_url(vegan.id), {'tags': [theirs.id]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+        self.assertTrue(Tag.objects.filter(id=theirs.id).exists())
+
+    def test_gc_tags(self):
+        """Test unused tags are deleted and used ones kept."""
+        self._recipe(['Vegan', 'vegan '])
+        Tag.objects.create(user=self.user, name='Unused')
+        Tag.objects.create(user=self.user, name='VEGAN')
+        out = StringIO()
+
+        call_command(
+            'gc_tags', '--merge-duplicates', '--batch-size', '1', stdout=out)
+
+        self.assertEqual(self._counts(), {'Vegan': 1})
+        self.assertIn('Merged 1 duplicate tags', out.getvalue())
+        self.assertIn('Deleted 1 unused tags in total', out.getvalue())
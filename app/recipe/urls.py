@@ -1,5 +1,6 @@
 from django.urls import (path, include)
 from recipe import views
+from recipe.async_views import async_view
 from rest_framework.routers import DefaultRouter
 
 
@@ -11,6 +12,24 @@ app_name = 'recipe' # for the reverse lookup of urls
 
 urlpatterns = [
     path('', include(router.urls)),
+    path(
+        'async/recipes/',
+        async_view(
+            views.RecipeViewSet, {'get': 'list', 'post': 'create'},
+            basename='recipe', detail=False),
+        name='async-recipe-list'),
+    path(
+        'async/recipes/<int:pk>/',
+        async_view(
+            views.RecipeViewSet, {'get': 'retrieve'},
+            basename='recipe', detail=True),
+        name='async-recipe-detail'),
+    path(
+        'async/tags/',
+        async_view(
+            views.TagViewSet, {'get': 'list'},
+            basename='tag', detail=False),
+        name='async-tag-list'),
     # path('token/',views.CreateTokenView.as_view(), name='token'),
     # path('me/',views.ManageUserView.as_view(), name='me'),
-]
\ No newline at end of file
+]
@@ -1,29 +1,220 @@
 #from django.contrib.auth.models import User
 from recipe import serializers
-from core.models import Recipe, Tag
+from core.models import Recipe, RecipeImport, Tag
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from drf_spectacular.utils import (
+    extend_schema_view,
+    extend_schema,
+    OpenApiParameter,
+    OpenApiTypes,
+)
 from rest_framework import (
     viewsets,
     mixins,
+    serializers as drf_serializers,
+    status,
 )
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, UnsupportedMediaType
 #from rest_framework.permissions import IsAdminUser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from core import jobs
+from core.signals import batched_changes
+from job.serializers import JobSerializer
+from recipe import bulk, export, imports, tasks
+from recipe.mixins import (
+    ConditionalListMixin,
+    ConditionalRetrieveMixin,
+    QueryPlanMixin,
+    SparseFieldsetMixin,
+    plan_queryset,
+)
+from recipe.pagination import IdCursorPagination
+from recipe.parsers import CSVParser, NDJSONParser
+from user.authentication import CachedTokenAuthentication
+
+
+class ImportInProgress(APIException):
+    status_code = 409
+    default_detail = 'The import is being resumed by another request.'
+    default_code = 'import_in_progress'
+
+
+# Portable column ranges, bounding numbers passed to the database
+INTEGER_RANGES = BaseDatabaseOperations.integer_field_ranges
+
+
+def _is_id(value):
+    """Return whether a bulk request item is an integer id, not a bool"""
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+FILTER_PARAMETERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma separated list of tag IDs to filter',
+    ),
+    OpenApiParameter(
+        'min_price',
+        OpenApiTypes.DECIMAL,
+        description='Lowest price to include',
+    ),
+    OpenApiParameter(
+        'max_price',
+        OpenApiTypes.DECIMAL,
+        description='Highest price to include',
+    ),
+    OpenApiParameter(
+        'max_time',
+        OpenApiTypes.INT,
+        description='Longest time_minutes to include',
+    ),
+    OpenApiParameter(
+        'search',
+        OpenApiTypes.STR,
+        description='Text to search for in title and description',
+    ),
+]
+
+SPARSE_FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated list of the fields to return',
+    ),
+    OpenApiParameter(
+        'expand',
+        OpenApiTypes.STR,
+        description=(
+            'Comma separated list of fields to add to the returned ones, '
+            'such as description on lists'),
+    ),
+]
+
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=FILTER_PARAMETERS + SPARSE_FIELDSET_PARAMETERS),
+    retrieve=extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS),
+    export=extend_schema(
+        parameters=FILTER_PARAMETERS + SPARSE_FIELDSET_PARAMETERS + [
+            OpenApiParameter(
+                'output',
+                OpenApiTypes.STR,
+                enum=list(export.FORMATS),
+                description='Export format, ndjson (default) or csv',
+            ),
+        ],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR,
+                   (200, 'text/csv'): OpenApiTypes.STR},
+    ),
+    import_recipes=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'resume',
+                OpenApiTypes.INT,
+                description='ID of a failed import to resume',
+            ),
+            OpenApiParameter(
+                'background',
+                OpenApiTypes.BOOL,
+                description='Import in a background job, answering 202',
+            ),
+        ],
+        request={'application/x-ndjson': OpenApiTypes.STR,
+                 'text/csv': OpenApiTypes.STR},
+        responses=serializers.RecipeImportSerializer,
+    ),
+)
+class RecipeViewSet(
+        SparseFieldsetMixin,
+        QueryPlanMixin,
+        ConditionalListMixin,
+        ConditionalRetrieveMixin,
+        viewsets.ModelViewSet):
     """View for managing recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = IdCursorPagination
+    query_plan_actions = ('list', 'retrieve', 'export')
+    sparse_fieldset_actions = ('list', 'retrieve', 'export')
+
+    def _params_to_ints(self, name, value):
+        """Convert a comma separated list of strings to integers."""
+        low, high = INTEGER_RANGES['BigAutoField']
+        try:
+            ids = [int(str_id) for str_id in value.split(',')]
+        except ValueError:
+            ids = None
+        if ids is None or not all(low <= pk <= high for pk in ids):
+            raise drf_serializers.ValidationError(
+                {name: ['Expected a comma separated list of integers.']})
+        return ids
+
+    def _param_to_number(self, name, value, number_type):
+        """
+        Convert value to an int or Decimal, rejecting integers outside
+        the range of an IntegerField and non-finite decimals.
+        """
+        try:
+            number = number_type(value)
+        except (ValueError, InvalidOperation):
+            number = None
+        if number_type is int:
+            low, high = INTEGER_RANGES['IntegerField']
+            valid = number is not None and low <= number <= high
+        else:
+            valid = number is not None and number.is_finite()
+        if not valid:
+            raise drf_serializers.ValidationError(
+                {name: ['Expected a number.']})
+        return number
+
+    def _filter_queryset(self, queryset):
+        """Apply the list filters given as query parameters."""
+        params = self.request.query_params
+        if params.get('tags'):
+            tag_ids = self._params_to_ints('tags', params['tags'])
+            queryset = queryset.filter(tags__id__in=tag_ids).distinct()
+        if params.get('min_price'):
+            queryset = queryset.filter(price__gte=self._param_to_number(
+                'min_price', params['min_price'], Decimal))
+        if params.get('max_price'):
+            queryset = queryset.filter(price__lte=self._param_to_number(
+                'max_price', params['max_price'], Decimal))
+        if params.get('max_time'):
+            queryset = queryset.filter(time_minutes__lte=self._param_to_number(
+                'max_time', params['max_time'], int))
+        if params.get('search'):
+            search = params['search']
+            queryset = queryset.filter(
+                Q(title__icontains=search) | Q(description__icontains=search)
+            )
+        return queryset
 
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action in ('list', 'export'):
+            queryset = self._filter_queryset(queryset)
+        return self.plan_queryset(queryset.order_by('-id'))
 
     def get_serializer_class(self):
         if self.action == 'list':
-            return serializers.RecipeSerializer
+            return serializers.FastRecipeSerializer
+        if self.action == 'export':
+            return serializers.ExportRecipeSerializer
 
         return self.serializer_class
 
@@ -36,7 +227,176 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        with batched_changes(instance.user_id):
+            instance.delete()
+
+    def _get_bulk_items(self, request):
+        """Return the request body as a list of bulk items."""
+        items = request.data
+        if not isinstance(items, list):
+            raise drf_serializers.ValidationError(
+                {'non_field_errors': ['Expected a list of items.']})
+        if len(items) > settings.API_BULK_MAX_ITEMS:
+            raise drf_serializers.ValidationError({
+                'non_field_errors': [
+                    'Expected at most %d items.' % settings.API_BULK_MAX_ITEMS
+                ]
+            })
+        return items
+
+    def _bulk_response(self, recipes, status_code):
+        """Serialize recipes in request order with their tags prefetched."""
+        ids = [recipe.id for recipe in recipes]
+        serializer = self.get_serializer(many=True)
+        planned = plan_queryset(
+            self.get_queryset().filter(id__in=ids), serializer)
+        by_id = {recipe.id: recipe for recipe in planned}
+        serializer.instance = [by_id[recipe_id] for recipe_id in ids]
+        return Response(serializer.data, status=status_code)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every matching recipe as NDJSON or CSV."""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            raise drf_serializers.ValidationError({
+                'output': ['Expected one of: %s.' % ', '.join(export.FORMATS)]
+            })
+        serializer = self.get_serializer(many=True)
+        pages = export.iter_pages(
+            self.get_queryset(),
+            serializer,
+            settings.API_EXPORT_CHUNK_SIZE,
+        )
+        content_type, extension = export.FORMATS[output]
+        if output == 'csv':
+            stream = export.csv_stream(pages, list(serializer.child.fields))
+        else:
+            stream = export.ndjson_stream(pages)
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.%s"' % extension)
+        return response
+
+    @action(
+        detail=False, methods=['post'], url_path='import', url_name='import',
+        parser_classes=[NDJSONParser, CSVParser])
+    def import_recipes(self, request):
+        """
+        Create recipes from an NDJSON or CSV upload in batches, resuming
+        the import given by ?resume= after its committed rows. With
+        ?background=true the upload is stored and imported by a job.
+        """
+        resume = request.query_params.get('resume')
+        if resume:
+            recipe_import = get_object_or_404(
+                RecipeImport.objects.exclude(status=RecipeImport.COMPLETED),
+                pk=self._param_to_number('resume', resume, int),
+                user=request.user,
+            )
+        else:
+            recipe_import = RecipeImport.objects.create(user=request.user)
+
+        if request.query_params.get('background') in ('1', 'true'):
+            return self._enqueue_import(request, recipe_import)
+        try:
+            imports.import_rows(
+                recipe_import,
+                request.data,
+                self.get_serializer_class(),
+                self.get_serializer_context(),
+                settings.API_IMPORT_BATCH_SIZE,
+            )
+        except imports.ImportConflict:
+            raise ImportInProgress()
+
+        return Response(
+            serializers.RecipeImportSerializer(recipe_import).data,
+            status=(
+                status.HTTP_201_CREATED
+                if recipe_import.status == RecipeImport.COMPLETED
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
+
+    def _enqueue_import(self, request, recipe_import):
+        """Store the upload unparsed and queue a job importing it."""
+        parser = request.negotiator.select_parser(request, request.parsers)
+        if parser is None:
+            raise UnsupportedMediaType(request.content_type)
+        output = tasks.FORMATS[type(parser)]
+        file = tasks.save_upload(
+            request.stream or io.BytesIO(),
+            tasks.upload_name(recipe_import, output))
+        job = jobs.enqueue(
+            'recipe.import', user=request.user,
+            import_id=recipe_import.pk, file=file, output=output)
+        return Response(
+            JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Create a list of recipes in one transaction."""
+        serializer = self.get_serializer(
+            data=self._get_bulk_items(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.save(user=request.user)
+        return self._bulk_response(recipes, status.HTTP_201_CREATED)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """Partially update a list of recipes identified by id."""
+        items = self._get_bulk_items(request)
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        instances = self.get_queryset().in_bulk(
+            [pk for pk in ids if _is_id(pk)])
+
+        updates = []
+        errors = []
+        for item in items:
+            instance = None
+            if isinstance(item, dict) and _is_id(item.get('id')):
+                instance = instances.get(item['id'])
+            if instance is None:
+                errors.append({'id': ['Recipe not found.']})
+                continue
+            serializer = self.get_serializer(instance, data=item, partial=True)
+            if serializer.is_valid():
+                updates.append((instance, serializer.validated_data))
+                errors.append({})
+            else:
+                errors.append(serializer.errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        recipes = bulk.update_recipes(request.user, updates)
+        return self._bulk_response(recipes, status.HTTP_200_OK)
+
+    @bulk.mapping.delete
+    def bulk_delete(self, request):
+        """Delete a list of recipes identified by id."""
+        items = self._get_bulk_items(request)
+        ids = [item for item in items if _is_id(item)]
+        owned = set(
+            self.get_queryset().filter(id__in=ids)
+            .values_list('id', flat=True)
+        )
+        errors = [
+            {} if _is_id(item) and item in owned
+            else {'id': ['Recipe not found.']}
+            for item in items
+        ]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        bulk.delete_recipes(
+            request.user, self.get_queryset().filter(id__in=owned))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class TagViewSet(
+        QueryPlanMixin,
+        ConditionalListMixin,
         mixins.UpdateModelMixin,
         mixins.ListModelMixin,
         mixins.DestroyModelMixin,
@@ -44,12 +404,77 @@ class TagViewSet(
     """Manage tags in the database"""
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = IdCursorPagination
+    stats_default_top = 20
+    stats_max_top = 1000
 
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        return self.plan_queryset(
+            self.queryset.filter(user=self.request.user).order_by('-id')
+        )
+
+    def perform_destroy(self, instance):
+        with batched_changes(instance.user_id):
+            instance.delete()
+
+    def _top(self):
+        """Return the validated ?top= number of tags to report."""
+        top = self.request.query_params.get('top', self.stats_default_top)
+        try:
+            top = int(top)
+        except ValueError:
+            top = 0
+        if not 1 <= top <= self.stats_max_top:
+            raise drf_serializers.ValidationError({
+                'top': [
+                    'Expected a number from 1 to %d.' % self.stats_max_top
+                ]
+            })
+        return top
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'top',
+                OpenApiTypes.INT,
+                description='Number of tags to return, 20 by default',
+            ),
+        ],
+        responses=serializers.TagStatsSerializer(many=True),
+    )
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """List the user's most used tags with their recipe counts."""
+        return self.conditional_response(
+            request, self.make_etag('stats', *self.get_collection_version()),
+            self._stats)
+
+    @extend_schema(
+        request=serializers.TagMergeSerializer,
+        responses=serializers.TagStatsSerializer,
+    )
+    @action(detail=True, methods=['post'])
+    def merge(self, request, pk=None):
+        """Fold other tags of the user into this one."""
+        target = self.get_object()
+        serializer = serializers.TagMergeSerializer(
+            data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        bulk.merge_tags(
+            request.user, target, serializer.validated_data['tags'])
+        target.refresh_from_db()
+        return Response(serializers.TagStatsSerializer(target).data)
+
+    def _stats(self, request):
+        tags = (
+            Tag.objects.filter(user=request.user)
+            .order_by('-recipe_count', 'id')
+            .values('id', 'name', 'recipe_count')[:self._top()]
+        )
+        return Response(serializers.TagStatsSerializer(tags, many=True).data)
 
 # class TagViewSet(viewsets.ModelViewSet):
 #     serializer_class = serializers.TagSerializer
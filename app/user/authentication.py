@@ -0,0 +1,71 @@
+"""
+Authentication classes for the API
+"""
+import copy
+import hashlib
+
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+from core import conf
+from core.cache import LRUCache
+from core.metrics import register_cache
+
+
+_options = conf.get('TOKEN_AUTH_CACHE')
+token_cache = LRUCache(
+    max_size=_options['MAX_SIZE'], ttl=_options['LOCAL_TTL'])
+register_cache('auth_token', token_cache)
+
+
+def _shared_cache():
+    alias = conf.get('TOKEN_AUTH_CACHE')['BACKEND']
+    return caches[alias] if alias else None
+
+
+def _cache_key(key):
+    """Return the cache key for a token without exposing the token."""
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    """Drop a token from the local and shared caches."""
+    cache_key = _cache_key(key)
+    token_cache.delete(cache_key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(cache_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that remembers token to user resolution.
+
+    When TOKEN_AUTH_CACHE['BACKEND'] names a cache alias, resolved (user,
+    token) pairs are kept in that shared cache for TTL seconds and every
+    request reads it, so deleting a token or saving its user revokes it
+    on all worker processes at once. Without a backend they are kept in
+    a bounded in-process LRU for LOCAL_TTL seconds, only invalidated in
+    the process making the change: other processes keep accepting a
+    deleted token or a deactivated user for up to LOCAL_TTL seconds.
+    Changes made with queryset update() bypass the invalidation signals
+    and are picked up once the entries expire.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        shared = _shared_cache()
+        if shared is not None:
+            cached = shared.get(cache_key)
+            if cached is None:
+                cached = super().authenticate_credentials(key)
+                shared.set(
+                    cache_key, cached, conf.get('TOKEN_AUTH_CACHE')['TTL'])
+        else:
+            cached = token_cache.get(cache_key)
+            if cached is None:
+                cached = super().authenticate_credentials(key)
+                token_cache.set(cache_key, cached)
+
+        user, token = cached
+        return copy.copy(user), copy.copy(token)
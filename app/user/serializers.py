@@ -5,8 +5,10 @@ from django.contrib.auth import (
     )
 from django.utils.translation import gettext as _
 
+from core.metrics import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the user model"""
 
     class Meta:
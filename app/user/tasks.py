@@ -0,0 +1,42 @@
+"""
+Background jobs for the user API
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core.jobs import task
+from core.models import Recipe, Tag
+from core.signals import batched_changes
+from recipe import bulk
+
+
+BATCH_SIZE = 1000
+
+
+@task('user.delete_account')
+def delete_account(context, user_id):
+    """
+    Delete a user's recipes and tags a batch at a time, so no transaction
+    holds locks on the whole collection, then the user.
+    """
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None:
+        return {'deleted': 0}
+    recipes = Recipe.objects.filter(user=user)
+    total = recipes.count()
+    context.progress(0, total)
+
+    deleted = 0
+    while True:
+        ids = list(recipes.order_by('id').values_list(
+            'id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        deleted += bulk.delete_recipes(user, recipes.filter(id__in=ids))
+        context.progress(deleted)
+
+    with transaction.atomic():
+        with batched_changes(user):
+            Tag.objects.filter(user=user).delete()
+        user.delete()
+    return {'deleted': deleted}
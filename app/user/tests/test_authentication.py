@@ -0,0 +1,97 @@
+"""
+Tests for the cached token authentication
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import _cache_key, token_cache
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test token resolution is cached and invalidated"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpassword123',
+            name='Test User',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_lookup_cached(self):
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_deleted_token_rejected(self):
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_visible_on_next_request(self):
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New Name'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New Name')
+
+    def test_invalid_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'tokens': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'test-tokens'},
+        },
+        TOKEN_AUTH_CACHE={'BACKEND': 'tokens'},
+    )
+    def test_shared_cache_bypasses_local_cache(self):
+        """Test a stale entry in a process's local cache is not used"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpassword123')
+        token_cache.set(
+            _cache_key(self.token.key),
+            (other, Token.objects.create(user=other)))
+
+        res = self.client.get(ME_URL)
+        self.token.delete()
+        revoked = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['email'], self.user.email)
+        self.assertEqual(revoked.status_code, status.HTTP_401_UNAUTHORIZED)
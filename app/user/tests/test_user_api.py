@@ -1,11 +1,19 @@
 """
 Tests for the user API
 """
-from django.test import TestCase
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from core import jobs
+from core.hashers import HashingBusy
+from core.models import Job, Recipe, Tag
+
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
 
@@ -120,6 +128,34 @@ class PublicUserApiTests(TestCase):
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_token_upgrades_password_hash(self):
+        """Test logging in rehashes a password with the current cost"""
+        with override_settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000}):
+            user = create_user(
+                email='test@example.com', password='testpassword123')
+        self.assertIn('$1000$', user.password)
+
+        with override_settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 2000}):
+            res = self.client.post(CREATE_TOKEN_URL, {
+                'email': 'test@example.com',
+                'password': 'testpassword123',
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertIn('$2000$', user.password)
+
+    @patch('core.hashers.offload', side_effect=HashingBusy)
+    def test_create_token_hashing_busy(self, patched_offload):
+        """Test a full hashing queue answers 503 with Retry-After"""
+        res = self.client.post(CREATE_TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': 'testpassword123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+
     def test_retrive_user_unauthorized(self):
         """Test authentication is required for users"""
         res = self.client.post(ME_URL)
@@ -162,4 +198,29 @@ class PrivateUserApiTest(TestCase):
         self.user.refresh_from_db()
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_account_in_background(self):
+        """Test deleting the account deactivates it then deletes it all."""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('1.00'))
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        Token.objects.create(user=self.user)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['name'], 'user.delete_account')
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+        jobs.Worker('test').run(burst=True)
+
+        job = Job.objects.get(pk=res.data['id'])
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {'deleted': 1})
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Tag.objects.exists())
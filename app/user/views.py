@@ -2,27 +2,65 @@ from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
 )
-from rest_framework import generics, authentication, permissions
+from drf_spectacular.utils import extend_schema
+from rest_framework import generics, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from core import jobs
+from core.hashers import HashingBusy
 from core.models import User
+from job.serializers import JobSerializer
+from user.authentication import CachedTokenAuthentication
 
 
-class CreateUserView(generics.CreateAPIView):
+class PasswordHashingBusy(APIException):
+    status_code = 503
+    default_detail = 'Too many password checks in progress, retry shortly.'
+    default_code = 'password_hashing_busy'
+    wait = 1
+
+
+class HashingBusyMixin:
+    """Answer 503 with Retry-After when the hashing pool sheds load."""
+
+    def handle_exception(self, exc):
+        if isinstance(exc, HashingBusy):
+            exc = PasswordHashingBusy()
+        return super().handle_exception(exc)
+
+
+class CreateUserView(HashingBusyMixin, generics.CreateAPIView):
     #queryset = User.objects.all()
     serializer_class = UserSerializer
     #permission_classes = [IsAdminUser]
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(HashingBusyMixin, ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(HashingBusyMixin, generics.RetrieveUpdateAPIView):
     #queryset = User.objects.all()
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
\ No newline at end of file
+        return self.request.user
+
+    @extend_schema(request=None, responses={202: JobSerializer})
+    def delete(self, request, *args, **kwargs):
+        """
+        Deactivate the account and its tokens now and delete it with its
+        recipes and tags in a background job.
+        """
+        user = self.get_object()
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        Token.objects.filter(user=user).delete()
+        job = jobs.enqueue('user.delete_account', user=user, user_id=user.pk)
+        return Response(
+            JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)